@@ -0,0 +1,138 @@
+import asyncio
+import functools
+import schemabuf.serialiser as serialiser
+from schemabuf.stream import FRAME_PACKER, READ_SIZE, frame, flush_streams, sync_streams, can_sync, check_sync, unframe
+
+OFFLOAD_SIZE = 0x10000
+
+
+async def _run(decode, size, executor, offload_size):
+  if offload_size is not None and size >= offload_size:
+    return await asyncio.get_running_loop().run_in_executor(executor, decode)
+  return decode()
+
+
+class AsyncRecordWriter:
+
+  # Writes length-framed records (the RecordWriter format) to an asyncio.StreamWriter, waiting for the transport to
+  # drain after each record so a slow peer applies backpressure to the producer. Stream filters are flushed after
+  # every record (see RecordWriter) so that each record reaches the peer as it is written. sync=True insists on it
+  # (raising ValueError for filters that can't sync), sync=False turns it off, and by default it happens whenever
+  # every stream filter can sync. Without it, compressed records (e.g. bz2 or lzma) are only sent as the compressor
+  # fills a block and on close(), so neither the peer nor backpressure sees them as they are written.
+
+  def __init__(self, writer, s_type, record_serialiser=None, sync=None):
+    self._writer = writer
+    self._type = s_type
+    self._serialiser = record_serialiser if record_serialiser is not None else serialiser.Serialiser([])
+    self._streams = self._serialiser.stream_serialisers()
+    if sync is None:
+      sync = can_sync(self._streams)
+    elif sync:
+      check_sync(self._streams)
+    self._sync = sync
+    self._closed = False
+
+  async def write(self, data, trusted=False):
+    if self._closed:
+      raise ValueError('Writer is closed')
+    data = frame(self._serialiser.serialise_record(self._type, data, trusted), self._streams)
+    if self._sync:
+      data += sync_streams(self._streams)
+    if len(data) > 0:
+      self._writer.write(data)
+    await self._writer.drain()
+
+  async def write_all(self, records, trusted=False):
+    for data in records:
+      await self.write(data, trusted)
+
+  async def flush(self):
+    if self._closed:
+      raise ValueError('Writer is closed')
+    check_sync(self._streams)
+    data = sync_streams(self._streams)
+    if len(data) > 0:
+      self._writer.write(data)
+    await self._writer.drain()
+
+  async def close(self):
+    # Flushes any stream filters. The StreamWriter itself is left open.
+    if self._closed:
+      return
+    self._closed = True
+    data = flush_streams(self._streams)
+    if len(data) > 0:
+      self._writer.write(data)
+    await self._writer.drain()
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, exc_type, exc_value, traceback):
+    await self.close()
+
+
+class AsyncRecordReader:
+
+  # Iterates (with async for) over the records read from an asyncio.StreamReader. Frames are decoded as soon as
+  # they are complete; frames of at least offload_size bytes are decoded on an executor (the loop's default one
+  # unless given) so a large record doesn't hold up the other tasks on the loop. offload_size=None decodes every
+  # frame inline.
+
+  def __init__(self, reader, s_type, record_serialiser=None, read_size=READ_SIZE, executor=None,
+               offload_size=OFFLOAD_SIZE):
+    self._reader = reader
+    self._type = s_type
+    self._serialiser = record_serialiser if record_serialiser is not None else serialiser.Serialiser([])
+    self._read_size = read_size
+    self._executor = executor
+    self._offload_size = offload_size
+
+  async def _decode(self, payload):
+    decode = functools.partial(self._serialiser.deserialise_record, self._type, payload)
+    return await _run(decode, len(payload), self._executor, self._offload_size)
+
+  async def __aiter__(self):
+    streams = self._serialiser.stream_deserialisers()
+    pending = bytearray()
+    while True:
+      chunk = await self._reader.read(self._read_size)
+      if not chunk:
+        break
+      for s in streams:
+        chunk = s.process(chunk)
+      pending += chunk
+      for payload in unframe(pending):
+        yield await self._decode(payload)
+    pending += flush_streams(streams)
+    for payload in unframe(pending):
+      yield await self._decode(payload)
+    if len(pending) > 0:
+      raise EOFError('Stream ended part way through a record')
+
+
+async def write_record(writer, s_type, data, record_serialiser=None, trusted=False):
+  # Writes a single framed record, applying every filter of record_serialiser to it alone, and waits for the writer
+  # to drain. Suits request/response protocols; use AsyncRecordWriter for a stream of records.
+  record_serialiser = record_serialiser if record_serialiser is not None else serialiser.Serialiser([])
+  writer.write(frame(record_serialiser.serialise(s_type, data, trusted), []))
+  await writer.drain()
+
+
+async def read_record(reader, s_type, record_serialiser=None, executor=None, offload_size=OFFLOAD_SIZE):
+  # Reads a single record written by write_record, or returns None if the stream ends before it starts
+  record_serialiser = record_serialiser if record_serialiser is not None else serialiser.Serialiser([])
+  try:
+    header = await reader.readexactly(FRAME_PACKER.size)
+  except asyncio.IncompleteReadError as e:
+    if len(e.partial) == 0:
+      return None
+    raise EOFError('Stream ended part way through a record')
+  try:
+    payload = await reader.readexactly(FRAME_PACKER.unpack(header)[0])
+  except asyncio.IncompleteReadError:
+    raise EOFError('Stream ended part way through a record')
+  decode = functools.partial(record_serialiser.deserialise, s_type, payload)
+  return await _run(decode, len(payload), executor, offload_size)
+
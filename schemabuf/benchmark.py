@@ -0,0 +1,254 @@
+import gc
+import sys
+import json
+import time
+import pickle
+import random
+import struct
+import argparse
+import platform
+import tracemalloc
+import schemabuf.schema.builder as schema
+
+# Benchmarks schemabuf against json, pickle and (where the data is flat) struct on synthetic datasets, e.g.
+#   python -m schemabuf.benchmark --records 2000 --output results.json
+
+WORDS = [ 'alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliett', 'kilo', 'lima' ]
+WIDE_TYPES = [ schema.model.Int32, schema.model.Int64, schema.model.Double, schema.model.Boolean ]
+
+
+def _plain(f_type, value):
+  # The value as plain Python data (dicts, lists and scalars), for the json and pickle baselines
+  if isinstance(f_type, schema.model.Struct):
+    if value is None:
+      return None
+    return { f.name: _plain(f.type, getattr(value, f.name)) for f in f_type.fields }
+  if isinstance(f_type, schema.model.List):
+    return [ _plain(f_type.element_type, e) for e in value ]
+  return value
+
+
+class Dataset:
+
+  def __init__(self, name, s_type, records, struct_codec=None):
+    self.name = name
+    self.s_type = s_type
+    self.records = records
+    self.plain = [ _plain(s_type, r) for r in records ]
+    # (encode, decode) functions for a raw struct baseline, when the records are flat enough to have one
+    self.struct_codec = struct_codec
+
+
+def wide_dataset(rng, count, width):
+  builder = schema.StructBuilder()
+  for i in range(width):
+    builder.field('f{}'.format(i), i + 1, WIDE_TYPES[i % len(WIDE_TYPES)])
+  s_type = builder.build()
+  fields = sorted(s_type.fields, key=lambda f: f.tag)
+  packer = struct.Struct('!' + ''.join([ f.type.FORMAT for f in fields ]))
+  records = []
+  for i in range(count):
+    record = s_type.create()
+    for f in fields:
+      if isinstance(f.type, schema.model.Boolean):
+        setattr(record, f.name, rng.random() < 0.5)
+      elif isinstance(f.type, schema.model.Double):
+        setattr(record, f.name, rng.random() * 1000)
+      else:
+        setattr(record, f.name, rng.randint(-1000000, 1000000))
+    records.append(record)
+
+  names = [ f.name for f in fields ]
+  encode = lambda d: packer.pack(*[ d[n] for n in names ])
+  decode = lambda b: dict(zip(names, packer.unpack(b)))
+  return Dataset('wide', s_type, records, (encode, decode))
+
+
+def deep_dataset(rng, count, depth):
+  s_type = None
+  for level in range(depth):
+    builder = schema.StructBuilder()\
+      .field('id', 0x1, schema.model.Int32)\
+      .field('label', 0x2, schema.model.String)
+    if s_type is not None:
+      builder.field('child', 0x3, s_type)
+    s_type = builder.build()
+
+  def make(f_type):
+    record = f_type.create()
+    record.id = rng.randint(0, 1000000)
+    record.label = rng.choice(WORDS)
+    child = f_type.codec().field('child')
+    if child is not None:
+      record.child = make(child.type)
+    return record
+
+  return Dataset('deep', s_type, [ make(s_type) for i in range(count) ])
+
+
+def numeric_dataset(rng, count, size):
+  s_type = schema.StructBuilder()\
+    .field('values', 0x1, schema.model.List(schema.model.Double))\
+    .field('counts', 0x2, schema.model.List(schema.model.Int32))\
+    .build()
+  records = []
+  for i in range(count):
+    record = s_type.create()
+    record.values = [ rng.random() for j in range(size) ]
+    record.counts = [ rng.randint(0, 1 << 20) for j in range(size) ]
+    records.append(record)
+
+  packer = struct.Struct('!I')
+
+  def encode(d):
+    return b''.join([
+      packer.pack(len(d['values'])), struct.pack('!{}d'.format(len(d['values'])), *d['values']),
+      packer.pack(len(d['counts'])), struct.pack('!{}i'.format(len(d['counts'])), *d['counts'])
+    ])
+
+  def decode(b):
+    n = packer.unpack_from(b, 0)[0]
+    values = list(struct.unpack_from('!{}d'.format(n), b, packer.size))
+    offset = packer.size + n * 8
+    m = packer.unpack_from(b, offset)[0]
+    counts = list(struct.unpack_from('!{}i'.format(m), b, offset + packer.size))
+    return { 'values': values, 'counts': counts }
+
+  return Dataset('numeric', s_type, records, (encode, decode))
+
+
+def strings_dataset(rng, count, size):
+  s_type = schema.StructBuilder()\
+    .field('title', 0x1, schema.model.String)\
+    .field('tags', 0x2, schema.model.List(schema.model.String))\
+    .build()
+  records = []
+  for i in range(count):
+    record = s_type.create()
+    record.title = ' '.join([ rng.choice(WORDS) for j in range(8) ])
+    record.tags = [ rng.choice(WORDS) + str(rng.randint(0, 99)) for j in range(size) ]
+    records.append(record)
+
+  return Dataset('strings', s_type, records)
+
+
+# Result key, column title, title format and value format for the printed table
+COLUMNS = [
+  ('dataset', 'dataset', '{:<8}', '{:<8}'),
+  ('format', 'format', '{:<10}', '{:<10}'),
+  ('encode_ops_per_sec', 'encode/s', '{:>10}', '{:>10.0f}'),
+  ('decode_ops_per_sec', 'decode/s', '{:>10}', '{:>10.0f}'),
+  ('bytes_per_record', 'bytes/rec', '{:>10}', '{:>10.1f}'),
+  ('encode_peak_bytes', 'enc peak', '{:>10}', '{:>10}'),
+  ('decode_peak_bytes', 'dec peak', '{:>10}', '{:>10}'),
+]
+
+DATASETS = {
+  'wide': lambda rng, args: wide_dataset(rng, args.records, args.width),
+  'deep': lambda rng, args: deep_dataset(rng, args.records, args.depth),
+  'numeric': lambda rng, args: numeric_dataset(rng, args.records, args.list_size),
+  'strings': lambda rng, args: strings_dataset(rng, args.records, args.list_size),
+}
+
+
+def codecs(dataset, trusted):
+  # (name, inputs, encode, decode) for each format that can encode the dataset
+  s_type = dataset.s_type
+  result = [
+    ('schemabuf', dataset.records, lambda d: s_type.serialise(d, trusted), s_type.deserialise),
+    ('json', dataset.plain, lambda d: json.dumps(d).encode('utf-8'), json.loads),
+    ('pickle', dataset.plain, lambda d: pickle.dumps(d, pickle.HIGHEST_PROTOCOL), pickle.loads),
+  ]
+  if dataset.struct_codec is not None:
+    encode, decode = dataset.struct_codec
+    result.append(('struct', dataset.plain, encode, decode))
+  return result
+
+
+def _best_time(fn, repeat):
+  best = None
+  for i in range(repeat):
+    gc.collect()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+
+def _peak_memory(fn):
+  gc.collect()
+  tracemalloc.start()
+  try:
+    result = fn()
+    return tracemalloc.get_traced_memory()[1], result
+  finally:
+    tracemalloc.stop()
+
+
+def run_codec(dataset, name, inputs, encode, decode, repeat):
+  encoded = [ encode(d) for d in inputs ]
+  count = len(inputs)
+  encode_time = _best_time(lambda: [ encode(d) for d in inputs ], repeat)
+  decode_time = _best_time(lambda: [ decode(b) for b in encoded ], repeat)
+  encode_peak, _ = _peak_memory(lambda: [ encode(d) for d in inputs ])
+  decode_peak, _ = _peak_memory(lambda: [ decode(b) for b in encoded ])
+  return {
+    'dataset': dataset.name,
+    'format': name,
+    'records': count,
+    'encode_ops_per_sec': count / encode_time if encode_time > 0 else None,
+    'decode_ops_per_sec': count / decode_time if decode_time > 0 else None,
+    'bytes_per_record': sum([ len(b) for b in encoded ]) / count if count > 0 else 0,
+    'encode_peak_bytes': encode_peak,
+    'decode_peak_bytes': decode_peak,
+  }
+
+
+def run(args):
+  results = []
+  for name in args.datasets:
+    dataset = DATASETS[name](random.Random(args.seed), args)
+    for codec_name, inputs, encode, decode in codecs(dataset, args.trusted):
+      results.append(run_codec(dataset, codec_name, inputs, encode, decode, args.repeat))
+  return results
+
+
+def print_results(results, out=sys.stdout):
+  out.write(' '.join([ header.format(title) for key, title, header, cell in COLUMNS ]) + '\n')
+  for r in results:
+    out.write(' '.join([ cell.format(r[key]) for key, title, header, cell in COLUMNS ]) + '\n')
+
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(description='Benchmark schemabuf against json, pickle and struct')
+  parser.add_argument('--datasets', nargs='+', choices=sorted(DATASETS), default=sorted(DATASETS))
+  parser.add_argument('--records', type=int, default=1000, help='records per dataset')
+  parser.add_argument('--repeat', type=int, default=3, help='timing runs per measurement (the best is kept)')
+  parser.add_argument('--width', type=int, default=32, help='fields in the wide struct')
+  parser.add_argument('--depth', type=int, default=8, help='nesting depth of the deep struct')
+  parser.add_argument('--list-size', type=int, default=100, help='elements in each numeric and string list')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--trusted', action='store_true', help='skip validation when encoding with schemabuf')
+  parser.add_argument('--output', help='write the results to this file as JSON')
+  return parser.parse_args(argv)
+
+
+def main(argv=None):
+  args = parse_args(argv)
+  results = run(args)
+  print_results(results)
+  if args.output is not None:
+    report = {
+      'python': platform.python_version(),
+      'implementation': platform.python_implementation(),
+      'platform': platform.platform(),
+      'arguments': vars(args),
+      'results': results,
+    }
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,224 @@
+import itertools
+
+INITIAL_SIZE = 0x100
+CODE_NULL = b'\x00'
+VARINT_MASK = 0x7f
+VARINT_CONTINUE = 0x80
+VARINT_SHIFT = 7
+
+
+def varint_size(n):
+  return max(1, (n.bit_length() + VARINT_SHIFT - 1) // VARINT_SHIFT)
+
+
+class WriteBuffer:
+
+  # Growable output buffer. Values are packed in place with struct.pack_into, and the backing bytearray is only
+  # reallocated when it runs out of room (doubling each time).
+
+  def __init__(self, size=INITIAL_SIZE):
+    self.data = bytearray(size)
+    self.offset = 0
+    self.strings = None
+
+  @staticmethod
+  def wrap(data, offset=0):
+    # Writes into an existing buffer from offset. A bytearray grows as needed; any other writable buffer (such as a
+    # memoryview or mmap) must already be large enough.
+    buf = WriteBuffer.__new__(WriteBuffer)
+    buf.data = data
+    buf.offset = offset
+    buf.strings = None
+    return buf
+
+  def _grow(self, end):
+    if not isinstance(self.data, bytearray):
+      raise ValueError('Buffer too small')
+    self.data.extend(bytes(max(end, len(self.data) * 2) - len(self.data)))
+
+  def pack(self, packer, *values):
+    end = self.offset + packer.size
+    if end > len(self.data):
+      self._grow(end)
+    packer.pack_into(self.data, self.offset, *values)
+    self.offset = end
+
+  def reserve(self, n):
+    # Skips n bytes to be filled in later with pack_at, returning their offset
+    offset = self.offset
+    end = offset + n
+    if end > len(self.data):
+      self._grow(end)
+    self.offset = end
+    return offset
+
+  def pack_at(self, packer, offset, *values):
+    packer.pack_into(self.data, offset, *values)
+
+  def write_at(self, offset, b):
+    self.data[offset:offset + len(b)] = b
+
+  def write(self, b):
+    offset = self.offset
+    end = offset + len(b)
+    if end > len(self.data):
+      self._grow(end)
+    self.data[offset:end] = b
+    self.offset = end
+
+  def write_byte(self, b):
+    if self.offset >= len(self.data):
+      self._grow(self.offset + 1)
+    self.data[self.offset] = b
+    self.offset += 1
+
+  def write_varint(self, n):
+    while n > VARINT_MASK:
+      self.write_byte(n & VARINT_MASK | VARINT_CONTINUE)
+      n >>= VARINT_SHIFT
+    self.write_byte(n)
+
+  def clear(self):
+    self.offset = 0
+
+  def getbuffer(self):
+    return memoryview(self.data)[:self.offset]
+
+  def getvalue(self):
+    with self.getbuffer() as view:
+      return bytes(view)
+
+
+class ReadBuffer:
+
+  # Cursor over a bytes-like object (bytes, bytearray, mmap, memoryview). Fixed-width values are read with
+  # struct.unpack_from and byte ranges are returned as memoryview slices, so nothing is copied until a value is
+  # actually built.
+
+  def __init__(self, data, offset=0):
+    self.data = data
+    self.view = memoryview(data)
+    self.offset = offset
+    self.strings = None
+
+  def at(self, offset):
+    buf = ReadBuffer.__new__(ReadBuffer)
+    buf.data = self.data
+    buf.view = self.view
+    buf.offset = offset
+    buf.strings = self.strings
+    return buf
+
+  def skip(self, n):
+    end = self.offset + n
+    if end > len(self.data):
+      raise EOFError('Unexpected end of buffer')
+    self.offset = end
+
+  def unpack(self, packer):
+    end = self.offset + packer.size
+    if end > len(self.data):
+      raise EOFError('Unexpected end of buffer')
+    values = packer.unpack_from(self.data, self.offset)
+    self.offset = end
+    return values
+
+  def read(self, n):
+    end = self.offset + n
+    if end > len(self.data):
+      raise EOFError('Unexpected end of buffer')
+    b = self.view[self.offset:end]
+    self.offset = end
+    return b
+
+  def read_byte(self):
+    if self.offset >= len(self.data):
+      raise EOFError('Unexpected end of buffer')
+    b = self.data[self.offset]
+    self.offset += 1
+    return b
+
+  def read_varint(self):
+    data = self.data
+    offset = self.offset
+    result = 0
+    shift = 0
+    try:
+      while True:
+        b = data[offset]
+        offset += 1
+        result |= (b & VARINT_MASK) << shift
+        if b < VARINT_CONTINUE:
+          break
+        shift += VARINT_SHIFT
+    except IndexError:
+      raise EOFError('Unexpected end of buffer') from None
+    self.offset = offset
+    return result
+
+  def _find(self, code):
+    find = getattr(self.data, 'find', None)
+    if find is not None:
+      return find(code, self.offset)
+    # memoryview has no find, so search a copy of the remainder. Only legacy NUL-terminated strings need this.
+    end = bytes(self.view[self.offset:]).find(code)
+    return end + self.offset if end >= 0 else end
+
+  def read_until(self, code=CODE_NULL):
+    end = self._find(code)
+    if end < 0:
+      raise EOFError('Unexpected end of buffer')
+    b = self.view[self.offset:end]
+    self.offset = end + len(code)
+    return b
+
+  def skip_until(self, code=CODE_NULL):
+    end = self._find(code)
+    if end < 0:
+      raise EOFError('Unexpected end of buffer')
+    self.offset = end + len(code)
+
+
+class IterReadBuffer:
+
+  # Adapts the legacy byte iterator protocol (FieldType.deserialise_value) to the ReadBuffer interface
+
+  def __init__(self, b_iter):
+    self._iter = b_iter
+    self.strings = None
+
+  def unpack(self, packer):
+    return packer.unpack(self.read(packer.size))
+
+  def read(self, n):
+    b = bytes(itertools.islice(self._iter, n))
+    if len(b) < n:
+      raise EOFError('Unexpected end of buffer')
+    return b
+
+  def skip(self, n):
+    self.read(n)
+
+  def read_byte(self):
+    return next(self._iter)
+
+  def read_varint(self):
+    result = 0
+    shift = 0
+    while True:
+      b = next(self._iter)
+      result |= (b & VARINT_MASK) << shift
+      if b < VARINT_CONTINUE:
+        return result
+      shift += VARINT_SHIFT
+
+  def read_until(self, code=CODE_NULL):
+    b = bytearray()
+    c = next(self._iter)
+    while c != code[0]:
+      b.append(c)
+      c = next(self._iter)
+    return b
+
+  def skip_until(self, code=CODE_NULL):
+    self.read_until(code)
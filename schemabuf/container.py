@@ -0,0 +1,161 @@
+import mmap
+import array
+import struct
+import schemabuf.schema.model as model
+from schemabuf.buffer import WriteBuffer, ReadBuffer
+
+# Layout:
+# FILE_HEADER | version | schema fingerprint | records... | index | footer
+# The index holds the absolute offset of every record followed by the end offset of the last record. The footer
+# holds the offset of the index, the record count and FILE_FOOTER.
+
+FILE_HEADER = b'\x01<!SCHEMABUF\x1f'
+FILE_FOOTER = b'\x04'
+VERSION = 0x01
+PACK_VERSION = '!B'
+PACK_FOOTER = '!QQ'
+VERSION_PACKER = struct.Struct(PACK_VERSION)
+FOOTER_PACKER = struct.Struct(PACK_FOOTER)
+HEADER_SIZE = len(FILE_HEADER) + VERSION_PACKER.size + model.FINGERPRINT_SIZE
+FOOTER_SIZE = FOOTER_PACKER.size + len(FILE_FOOTER)
+
+
+class ContainerWriter:
+
+  def __init__(self, fileobj, s_type):
+    self._file = fileobj
+    self._type = s_type
+    self._buf = WriteBuffer()
+    self._offsets = array.array(model.INDEX_ARRAY_CODE)
+    self._offset = 0
+    self._closed = False
+    self._write(FILE_HEADER + VERSION_PACKER.pack(VERSION) + s_type.fingerprint())
+
+  def _write(self, b):
+    self._file.write(b)
+    self._offset += len(b)
+
+  def write(self, data, trusted=False):
+    if self._closed:
+      raise ValueError('Writer is closed')
+    if not trusted:
+      self._type.assert_valid(data)
+    self._buf.clear()
+    self._type.pack_message(self._buf, data)
+    self._offsets.append(self._offset)
+    self._write(self._buf.getbuffer())
+
+  def write_all(self, records, trusted=False):
+    for data in records:
+      self.write(data, trusted)
+
+  def close(self):
+    if self._closed:
+      return
+    self._closed = True
+    count = len(self._offsets)
+    self._offsets.append(self._offset)
+    if not model.NATIVE_BIG_ENDIAN:
+      self._offsets.byteswap()
+    index_offset = self._offset
+    self._write(memoryview(self._offsets).cast('B'))
+    self._write(FOOTER_PACKER.pack(index_offset, count) + FILE_FOOTER)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+
+class Container:
+
+  # Read-only access to a container file through mmap. Opening only reads the header and footer; records are
+  # decoded straight out of the mapping when they are indexed or iterated.
+
+  def __init__(self, fileobj, s_type):
+    self._type = s_type
+    self._mmap = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      self._open()
+    except:
+      self._mmap.close()
+      raise
+
+  def _open(self):
+    if len(self._mmap) < HEADER_SIZE + FOOTER_SIZE or self._mmap[:len(FILE_HEADER)] != FILE_HEADER:
+      raise ValueError('Not a schemabuf container')
+    if self._mmap[-len(FILE_FOOTER):] != FILE_FOOTER:
+      raise ValueError('Container is truncated')
+    version = VERSION_PACKER.unpack_from(self._mmap, len(FILE_HEADER))[0]
+    if version != VERSION:
+      raise ValueError('Unsupported container version: {}'.format(version))
+    fingerprint = self._mmap[HEADER_SIZE - model.FINGERPRINT_SIZE:HEADER_SIZE]
+    if fingerprint != self._type.fingerprint():
+      raise ValueError('Container was written with a different schema')
+    self._index, self._count = FOOTER_PACKER.unpack_from(self._mmap, len(self._mmap) - FOOTER_SIZE)
+    self._buf = ReadBuffer(self._mmap)
+
+  @staticmethod
+  def open(path, s_type):
+    with open(path, 'rb') as f:
+      return Container(f, s_type)
+
+  def offset(self, i):
+    return model.INDEX_PACKER.unpack_from(self._mmap, self._index + i * model.INDEX_PACKER.size)[0]
+
+  def _position(self, i):
+    if i < 0:
+      i += self._count
+    if i < 0 or i >= self._count:
+      raise IndexError('Container index out of range')
+    return i
+
+  def __len__(self):
+    return self._count
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      start, stop, step = i.indices(self._count)
+      if step == 1:
+        return self.decode_range(start, stop)
+      return [ self[j] for j in range(start, stop, step) ]
+    return self._type.unpack(self._type.open_message(self._buf.at(self.offset(self._position(i)))))
+
+  def view(self, i):
+    return self._type.unpack_view(self._type.open_message(self._buf.at(self.offset(self._position(i)))))
+
+  def decode_range(self, start, stop):
+    if start >= stop:
+      return []
+    buf = self._buf.at(self.offset(start))
+    open_message = self._type.open_message
+    unpack = self._type.unpack
+    return [ unpack(open_message(buf)) for i in range(start, stop) ]
+
+  def __iter__(self):
+    # Records are contiguous, so iteration decodes them back to back from a single cursor
+    if self._count == 0:
+      return
+    buf = self._buf.at(self.offset(0))
+    open_message = self._type.open_message
+    unpack = self._type.unpack
+    for i in range(self._count):
+      yield unpack(open_message(buf))
+
+  def close(self):
+    # Views from view() may still be reading the mapping, in which case it's unmapped once the last of them is gone
+    self._buf = None
+    if self._mmap is None:
+      return
+    try:
+      self._mmap.close()
+    except BufferError:
+      pass
+    self._mmap = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
@@ -0,0 +1,100 @@
+import concurrent.futures
+import multiprocessing.shared_memory
+import schemabuf.container as container
+import schemabuf.schema.model as model
+from schemabuf.buffer import ReadBuffer
+
+CHUNKS_PER_WORKER = 4
+
+
+def _chunks(count, workers, chunk_size):
+  if chunk_size is None:
+    chunk_size = max(1, -(-count // (workers * CHUNKS_PER_WORKER)))
+  return [ (start, min(start + chunk_size, count)) for start in range(0, count, chunk_size) ]
+
+
+def _apply(records, transform):
+  if transform is None:
+    return records
+  return [ transform(r) for r in records ]
+
+
+def _decode_container_range(path, s_type, start, stop, transform):
+  with container.Container.open(path, s_type) as c:
+    return _apply(c.decode_range(start, stop), transform)
+
+
+def _decode_shared_range(name, s_type, element_type, offset, count, transform):
+  shm = multiprocessing.shared_memory.SharedMemory(name=name)
+  buf = ReadBuffer(shm.buf)
+  try:
+    s_type.open_message(buf)
+    buf.offset = offset
+    unpack = element_type.unpack
+    records = [ unpack(buf) for i in range(count) ]
+    return _apply(records, transform)
+  finally:
+    # The segment can't be closed while the buffer still exports it
+    buf.view.release()
+    shm.close()
+
+
+def _workers(workers):
+  return workers if workers is not None else multiprocessing.cpu_count()
+
+
+def _flatten(results):
+  records = []
+  for chunk in results:
+    records.extend(chunk)
+  return records
+
+
+# Decoded records have to be pickled back to the calling process, which costs about as much as decoding them.
+# Passing a (picklable) transform applies it to each record inside the workers, so only its results are sent back.
+
+def decode_container(path, s_type, workers=None, chunk_size=None, transform=None):
+  # Decodes every record of a container file across a process pool. Each worker maps the file itself, so only the
+  # decoded records are sent between processes.
+  workers = _workers(workers)
+  with container.Container.open(path, s_type) as c:
+    count = len(c)
+  chunks = _chunks(count, workers, chunk_size)
+  with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+    futures = [ executor.submit(_decode_container_range, path, s_type, start, stop, transform) for start, stop in chunks ]
+    return _flatten(f.result() for f in futures)
+
+
+def decode_list(s_type, data, field, workers=None, chunk_size=None, transform=None):
+  # Decodes the list field `field` of a serialised s_type message across a process pool. Chunk boundaries come
+  # from the list's offset index (or a skip scan for unindexed lists) and workers read the message from shared
+  # memory rather than from pickled copies.
+  # Columnar and fixed-width lists decode as single arrays, which leaves nothing to split, so they are decoded
+  # in this process.
+  f = s_type.codec().field(field)
+  if f is None:
+    raise ValueError('Unknown field: {}'.format(field))
+  if not isinstance(f.type, model.List):
+    raise TypeError('Field is not a list: {}'.format(field))
+  element_type = f.type.element_type
+  if f.type.columnar or isinstance(element_type, model.FixedWidth):
+    return _apply(getattr(s_type.deserialise(data, fields=[ field ]), field), transform)
+  workers = _workers(workers)
+  elements = getattr(s_type.deserialise(data, lazy=True), field)
+  count = len(elements)
+  chunks = _chunks(count, workers, chunk_size)
+  offsets = [ elements.offset(start) for start, stop in chunks ]
+  elements = None
+
+  shm = multiprocessing.shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+  try:
+    shm.buf[:len(data)] = data
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+      futures = [
+        executor.submit(_decode_shared_range, shm.name, s_type, element_type, offset, stop - start, transform)
+        for offset, (start, stop) in zip(offsets, chunks)
+      ]
+      return _flatten(f.result() for f in futures)
+  finally:
+    shm.close()
+    shm.unlink()
@@ -0,0 +1,69 @@
+import schemabuf.schema.model as model
+import schemabuf.schema.migration as migration
+from schemabuf.buffer import ReadBuffer
+
+# Payload layout:
+# schema fingerprint | message
+# The fingerprint (Struct.fingerprint) names the schema the message was written with, which must be registered
+# with the registry that reads it.
+
+
+class SchemaRegistry:
+
+  # Keeps every version of a schema that payloads may have been written with, by fingerprint, and decodes stamped
+  # payloads of any of them straight into the version the caller asks for. The decoder for each (writer, reader)
+  # pair is compiled once (a MigrationCodec, or the reader's own codec when the versions match) and cached, so a
+  # mix of versions costs a dictionary lookup per payload.
+
+  def __init__(self, schemas=()):
+    self._schemas = {}
+    self._migrations = {}
+    self._decoders = {}
+    for s_type in schemas:
+      self.register(s_type)
+
+  def register(self, s_type):
+    # Registers a schema version and returns its fingerprint. A fingerprint that is already registered keeps its
+    # first schema.
+    fingerprint = s_type.fingerprint()
+    self._schemas.setdefault(fingerprint, s_type)
+    return fingerprint
+
+  def schema(self, fingerprint):
+    s_type = self._schemas.get(bytes(fingerprint))
+    if s_type is None:
+      raise ValueError('Unknown schema fingerprint: {}'.format(bytes(fingerprint).hex()))
+    return s_type
+
+  def writer_schema(self, data):
+    # The registered schema a stamped payload was written with
+    return self.schema(data[:model.FINGERPRINT_SIZE])
+
+  def migration(self, writer, reader):
+    key = (writer.fingerprint(), reader)
+    codec = self._migrations.get(key)
+    if codec is None:
+      codec = self._migrations[key] = migration.MigrationCodec(writer, reader, self.migration)
+    return codec
+
+  def _decoder(self, fingerprint, reader):
+    writer = self.schema(fingerprint)
+    if writer.fingerprint() == reader.fingerprint():
+      r_codec = reader.codec()
+      decoder = lambda buf: r_codec.decode_value(r_codec.open_message(buf))
+    else:
+      decoder = self.migration(writer, reader).decode
+    self._decoders[(fingerprint, reader)] = decoder
+    return decoder
+
+  def serialise(self, s_type, data, trusted=False):
+    self.register(s_type)
+    return s_type.fingerprint() + s_type.serialise(data, trusted)
+
+  def deserialise(self, s_type, data):
+    # Decodes a payload written with any registered version of the schema as an s_type object
+    fingerprint = bytes(data[:model.FINGERPRINT_SIZE])
+    decoder = self._decoders.get((fingerprint, s_type))
+    if decoder is None:
+      decoder = self._decoder(fingerprint, s_type)
+    return decoder(ReadBuffer(data, model.FINGERPRINT_SIZE))
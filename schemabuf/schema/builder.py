@@ -5,6 +5,9 @@ class StructBuilder:
 
   def __init__(self):
     self._fields = []
+    self._skippable = False
+    self._intern_strings = False
+    self._presence_bitmap = False
 
   def field(self, name, tag, f_type):
     if isinstance(f_type, type) and issubclass(f_type, model.FieldType):
@@ -15,5 +18,25 @@ class StructBuilder:
 
     return self
 
+  def skippable(self):
+    self._skippable = True
+
+    return self
+
+  def intern_strings(self):
+    self._intern_strings = True
+
+    return self
+
+  def presence_bitmap(self):
+    self._presence_bitmap = True
+
+    return self
+
   def build(self):
-    return model.Struct(self._fields)
+    return model.Struct(
+      self._fields,
+      skippable=self._skippable,
+      intern_strings=self._intern_strings,
+      presence_bitmap=self._presence_bitmap
+    )
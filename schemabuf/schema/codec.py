@@ -0,0 +1,405 @@
+import sys
+import struct
+import operator
+import schemabuf.schema.model as model
+from schemabuf.buffer import WriteBuffer, ReadBuffer
+
+
+FORMAT_PREFIX = '!'
+MUTABLE_DEFAULTS = (list, dict, set)
+FALSY_DEFAULTS = (type(None), bool, int, float, str, list)
+BITS = 8
+# Plans are cached per header, and headers come from the messages being read, so a cache is emptied once it holds
+# this many plans rather than growing with every distinct set of fields (up to 2^n for a struct of n fields)
+MAX_PLANS = 0x400
+
+
+def _cache(plans, key, plan):
+  if len(plans) >= MAX_PLANS:
+    plans.clear()
+  plans[key] = plan
+  return plan
+
+
+def _packer(f_type):
+  if isinstance(f_type, model.Struct):
+    return f_type.codec().encode_value
+  return f_type.pack
+
+
+def _unpacker(f_type):
+  if isinstance(f_type, model.Struct):
+    return f_type.codec().decode_value
+  return f_type.unpack
+
+
+def _skipper(f_type):
+  if isinstance(f_type, model.Struct):
+    return f_type.codec().skip_value
+  return f_type.skip
+
+
+class StructCodec:
+
+  # Compiled encoder/decoder for a single Struct schema. Encode plans are cached per presence mask and decode
+  # plans per tag header, so each distinct shape of message is only planned once. Adjacent fixed-width values in
+  # a plan are packed and unpacked with a single struct.Struct.
+
+  def __init__(self, s_type):
+    self._struct = s_type
+    self._fields = sorted(s_type.fields, key=lambda f: f.tag)
+    self._field_map = { f.tag: f for f in self._fields }
+    self._name_map = { f.name: f for f in self._fields }
+    self._index = { f.tag: i for i, f in enumerate(self._fields) }
+    # Objects are instances of a class generated for the schema, with a slot per field. The codec reads all the
+    # fields at once with an attrgetter and writes them through the slot descriptors, bypassing validation.
+    self.object_class = self._object_class()
+    self._getter = operator.attrgetter(*[ f.name for f in self._fields ]) if len(self._fields) > 1 else None
+    self._setters = [ self.object_class.__dict__[f.name].__set__ for f in self._fields ]
+    self._setter_map = { f.name: self._setters[i] for i, f in enumerate(self._fields) }
+    # Fields whose default is falsy (every built-in type) are present exactly when their value is truthy, which is
+    # cheaper to test than comparing against the default. Any other default is compared against a cached copy.
+    self._truthy = []
+    self._compared = []
+    self._defaults = []
+    self._factories = []
+    for i, f in enumerate(self._fields):
+      default = f.type.default()
+      if isinstance(default, FALSY_DEFAULTS) and not default:
+        self._truthy.append((i, 1 << i))
+      else:
+        self._compared.append((i, default, 1 << i))
+      if isinstance(default, MUTABLE_DEFAULTS):
+        self._factories.append((i, f.type.default))
+      else:
+        self._defaults.append((i, default))
+    # Bitmap headers are a fixed number of bytes with bit tag - 1 set for each present field, lowest bit first
+    self._header_size = (max([ f.tag for f in self._fields ], default=0) + BITS - 1) // BITS
+    known_bits = bytearray(self._header_size)
+    for f in self._fields:
+      known_bits[(f.tag - 1) // BITS] |= 1 << (f.tag - 1) % BITS
+    self._known_bits = bytes(known_bits)
+    # Skippable structs prefix each field that can't be skipped in constant time with its byte length
+    self._wire_types = {}
+    for f in self._fields:
+      if s_type.skippable and not f.type.skips_in_constant_time():
+        self._wire_types[f.tag] = model.Delimited(f.type)
+      else:
+        self._wire_types[f.tag] = f.type
+    self._encode_plans = {}
+    self._size_plans = {}
+    self._decode_plans = {}
+    self._skip_plans = {}
+    self._layouts = {}
+
+  def _object_class(self):
+    return type('StructObject', (model.StructObject,), {
+      '__slots__': tuple([ f.name for f in self._fields ]),
+      '_struct': self._struct,
+      '_validators': { f.name: f.type.assert_valid for f in self._fields }
+    })
+
+  def _group(self, fields):
+    # Splits fields into runs of adjacent fixed-width fields (packed together) and single variable-width fields
+    steps = []
+    run = []
+    for f in fields + [None]:
+      if f is not None and isinstance(f.type, model.FixedWidth):
+        run.append(f)
+        continue
+      if len(run) > 0:
+        steps.append((struct.Struct(FORMAT_PREFIX + ''.join(r.type.FORMAT for r in run)), run))
+        run = []
+      if f is not None:
+        steps.append((None, f))
+
+    return steps
+
+  def _encode_plan(self, mask):
+    fields = [ f for i, f in enumerate(self._fields) if mask & 1 << i ]
+    if self._struct.presence_bitmap:
+      header = bytearray(self._header_size)
+      for f in fields:
+        header[(f.tag - 1) // BITS] |= 1 << (f.tag - 1) % BITS
+      header = bytes(header)
+    else:
+      header = bytes([len(fields)] + [ f.tag - 1 for f in fields ])
+    steps = []
+    for packer, f in self._group(fields):
+      if packer is not None:
+        steps.append((packer, [ self._index[r.tag] for r in f ], None))
+      else:
+        steps.append((None, self._index[f.tag], _packer(self._wire_types[f.tag])))
+    return _cache(self._encode_plans, mask, (header, steps))
+
+  def _size_plan(self, mask):
+    # The size of the header and fixed-width fields, and the sizers of the other fields
+    fields = [ f for i, f in enumerate(self._fields) if mask & 1 << i ]
+    size = self._header_size if self._struct.presence_bitmap else 1 + len(fields)
+    sizers = []
+    for packer, f in self._group(fields):
+      if packer is not None:
+        size += packer.size
+      else:
+        sizers.append((self._index[f.tag], model.value_sizer(self._wire_types[f.tag])))
+    return _cache(self._size_plans, mask, (size, sizers))
+
+  def _decode_plan(self, header):
+    # Steps that read the present fields, and the setters and defaults (or default factories) of the absent ones
+    fields = self.header_fields(header)
+    steps = []
+    for packer, f in self._group(fields):
+      if packer is not None:
+        steps.append((packer, [ self._setter_map[r.name] for r in f ], None))
+      else:
+        steps.append((None, self._setter_map[f.name], _unpacker(self._wire_types[f.tag])))
+    present = { self._index[f.tag] for f in fields }
+    defaults = [ (self._setters[i], default) for i, default in self._defaults if i not in present ]
+    factories = [ (self._setters[i], factory) for i, factory in self._factories if i not in present ]
+    return _cache(self._decode_plans, header, (steps, defaults, factories))
+
+  def _skip_plan(self, header):
+    steps = []
+    for packer, f in self._group(self.header_fields(header)):
+      steps.append(packer.size if packer is not None else _skipper(self._wire_types[f.tag]))
+    return _cache(self._skip_plans, header, steps)
+
+  def field(self, name):
+    return self._name_map.get(name)
+
+  def header(self, mask):
+    # The header written for the fields in a presence mask
+    plan = self._encode_plans.get(mask)
+    if plan is None:
+      plan = self._encode_plan(mask)
+    return plan[0]
+
+  def read_header(self, buf):
+    if self._struct.presence_bitmap:
+      return bytes(buf.read(self._header_size))
+    return bytes(buf.read(buf.read_byte()))
+
+  def header_fields(self, header):
+    # Plans are cached by header, so only the one header the encoder writes for each set of fields is accepted:
+    # tags in ascending order, and no bits set for tags the struct doesn't have
+    if self._struct.presence_bitmap:
+      if any([ b & ~known for b, known in zip(header, self._known_bits) ]):
+        raise ValueError('Malformed struct header')
+      return [ f for f in self._fields if header[(f.tag - 1) // BITS] & 1 << (f.tag - 1) % BITS ]
+    if any([ header[i] >= header[i + 1] for i in range(len(header) - 1) ]):
+      raise ValueError('Malformed struct header')
+    fields = [ self._field_map.get(tag + 1) for tag in header ]
+    if None in fields:
+      raise ValueError('Malformed struct header')
+    return fields
+
+  def values(self, data):
+    # The values of all fields of data, in tag order
+    if self._getter is not None:
+      return self._getter(data)
+    return tuple([ getattr(data, f.name) for f in self._fields ])
+
+  def setter(self, name):
+    # Function (obj, value) that sets a field without validating the value
+    return self._setter_map[name]
+
+  def presence_mask(self, data):
+    # Bit i is set when the i-th field (in tag order) differs from its default
+    return self._mask(self.values(data))
+
+  def _mask(self, values):
+    mask = 0
+    for i, bit in self._truthy:
+      if values[i]:
+        mask |= bit
+    for i, default, bit in self._compared:
+      if values[i] != default:
+        mask |= bit
+    return mask
+
+  def layout(self, header):
+    # Names and wire types of the fields in wire order, how to skip each one (a width for fixed-width fields) and
+    # their positions by name
+    layout = self._layouts.get(header)
+    if layout is None:
+      fields = self.header_fields(header)
+      types = [ self._wire_types[f.tag] for f in fields ]
+      skippers = [ t.PACKER.size if isinstance(t, model.FixedWidth) else _skipper(t) for t in types ]
+      layout = [ f.name for f in fields ], types, skippers, { f.name: i for i, f in enumerate(fields) }
+      _cache(self._layouts, header, layout)
+    return layout
+
+  def encode_value(self, buf, data):
+    if data is None:
+      return
+    values = self._getter(data) if self._getter is not None else self.values(data)
+    mask = 0
+    for i, bit in self._truthy:
+      if values[i]:
+        mask |= bit
+    for i, default, bit in self._compared:
+      if values[i] != default:
+        mask |= bit
+    plan = self._encode_plans.get(mask)
+    if plan is None:
+      plan = self._encode_plan(mask)
+    header, steps = plan
+    buf.write(header)
+    for packer, indices, pack in steps:
+      if packer is not None:
+        buf.pack(packer, *[ values[i] for i in indices ])
+      else:
+        pack(buf, values[indices])
+
+  def size_value(self, data):
+    # Number of bytes encode_value writes for data
+    if data is None:
+      return 0
+    values = self.values(data)
+    mask = self._mask(values)
+    plan = self._size_plans.get(mask)
+    if plan is None:
+      plan = self._size_plan(mask)
+    size, sizers = plan
+    for i, sizer in sizers:
+      size += sizer(values[i])
+    return size
+
+  def new_object(self):
+    obj = object.__new__(self.object_class)
+    setters = self._setters
+    for i, default in self._defaults:
+      setters[i](obj, default)
+    for i, factory in self._factories:
+      setters[i](obj, factory())
+    return obj
+
+  def from_values(self, values):
+    # Builds an object from the values of all its fields, in tag order
+    obj = object.__new__(self.object_class)
+    for set_value, value in zip(self._setters, values):
+      set_value(obj, value)
+    return obj
+
+  def decode_value(self, buf):
+    obj = object.__new__(self.object_class)
+    header = self.read_header(buf)
+    plan = self._decode_plans.get(header)
+    if plan is None:
+      plan = self._decode_plan(header)
+    steps, defaults, factories = plan
+    for set_value, default in defaults:
+      set_value(obj, default)
+    for set_value, factory in factories:
+      set_value(obj, factory())
+    for packer, setters, unpack in steps:
+      if packer is not None:
+        for set_value, value in zip(setters, buf.unpack(packer)):
+          set_value(obj, value)
+      else:
+        setters(obj, unpack(buf))
+
+    return obj
+
+  def decode_projected(self, buf, projection):
+    # projection maps field names to the projection of their value, or None to decode the whole value. All other
+    # fields are skipped and left at their default.
+    obj = self.new_object()
+    names, types, skippers, positions = self.layout(self.read_header(buf))
+    for i, name in enumerate(names):
+      if name in projection:
+        sub = projection[name]
+        self._setter_map[name](obj, types[i].unpack(buf) if sub is None else types[i].unpack_projected(buf, sub))
+      elif isinstance(skippers[i], int):
+        buf.skip(skippers[i])
+      else:
+        skippers[i](buf)
+
+    return obj
+
+  def projection(self, fields):
+    # Builds a projection from dotted field paths, e.g. ['email', 'name.first_name']
+    projection = {}
+    for path in fields:
+      self._add_projection(projection, path.split('.'), path)
+    return projection
+
+  def _add_projection(self, projection, parts, path):
+    field = self.field(parts[0])
+    if field is None:
+      raise ValueError('Unknown field: {}'.format(path))
+    if len(parts) == 1:
+      projection[field.name] = None
+      return
+    if field.name in projection and projection[field.name] is None:
+      return
+    f_type = field.type
+    while isinstance(f_type, model.List):
+      f_type = f_type.element_type
+    if not isinstance(f_type, model.Struct):
+      raise ValueError('Cannot project into field: {}'.format(path))
+    sub = projection.setdefault(field.name, {})
+    f_type.codec()._add_projection(sub, parts[1:], path)
+
+  def skip_value(self, buf):
+    header = self.read_header(buf)
+    steps = self._skip_plans.get(header)
+    if steps is None:
+      steps = self._skip_plan(header)
+    for step in steps:
+      if isinstance(step, int):
+        buf.skip(step)
+      else:
+        step(buf)
+
+  def encode_message(self, buf, data, encode_value=None):
+    # Encodes data as the root of a message, including the string table if the struct interns strings.
+    # encode_value replaces the codec's own root encoder (used when profiling).
+    if encode_value is None:
+      encode_value = self.encode_value
+    if not self._struct.intern_strings:
+      encode_value(buf, data)
+      return
+    body = WriteBuffer()
+    body.strings = {}
+    encode_value(body, data)
+    buf.write_varint(len(body.strings))
+    for string in body.strings:
+      b = string.encode(model.STR_ENCODING)
+      buf.write_varint(len(b))
+      buf.write(b)
+    buf.write(body.getbuffer())
+
+  def open_message(self, buf):
+    # Reads the message preamble written by encode_message, leaving buf at the root struct
+    if self._struct.intern_strings:
+      strings = []
+      for i in range(buf.read_varint()):
+        strings.append(sys.intern(str(buf.read(buf.read_varint()), model.STR_ENCODING)))
+      buf.strings = strings
+    return buf
+
+  def message_size(self, data):
+    if self._struct.intern_strings:
+      # The string table depends on which strings repeat, so measure an encoded copy
+      buf = WriteBuffer()
+      self.encode_message(buf, data)
+      return buf.offset
+    return self.size_value(data)
+
+  def encode_into(self, data, buffer, offset=0, trusted=False):
+    if not trusted:
+      self._struct.assert_valid(data)
+    buf = WriteBuffer.wrap(buffer, offset)
+    self.encode_message(buf, data)
+    return buf.offset
+
+  def encode(self, data, trusted=False):
+    if not trusted:
+      self._struct.assert_valid(data)
+    buf = WriteBuffer()
+    self.encode_message(buf, data)
+    return buf.getvalue()
+
+  def decode(self, data):
+    return self.decode_value(self.open_message(ReadBuffer(data)))
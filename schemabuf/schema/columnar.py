@@ -0,0 +1,210 @@
+import array
+import struct
+import schemabuf.schema.model as model
+
+# A columnar list of n structs is written as a presence bitmap (which elements are not None) followed by one
+# column per field, in tag order, holding that field's value for every present element:
+# - packed numeric fields: one contiguous network order array
+# - Boolean fields: a bitmap, lowest bit first
+# - String fields: n + 1 offsets into a blob of the concatenated UTF-8 bytes
+# - nested Struct fields: a nested columnar block
+# - anything else: the values packed back to back
+
+PACK_OFFSET = '!I'
+OFFSET_PACKER = struct.Struct(PACK_OFFSET)
+OFFSET_ARRAY_CODE = [ code for code in 'IL' if array.array(code).itemsize == OFFSET_PACKER.size ][0]
+BITS = 8
+UNPACK_BITS = [ tuple(b >> i & 1 == 1 for i in range(BITS)) for b in range(1 << BITS) ]
+PACK_BITS = { bits: b for b, bits in enumerate(UNPACK_BITS) }
+
+
+class Columns(dict):
+
+  # Decoded columns of a struct column, by field name. present is None when every element is present, otherwise a
+  # list of flags saying which elements are; the columns only hold values for the present elements.
+
+  def __init__(self, columns, present):
+    super().__init__(columns)
+    self.present = present
+
+
+def _pack_bitmap(buf, values):
+  n = len(values)
+  b = bytearray((n + BITS - 1) // BITS)
+  for i in range(0, n, BITS):
+    chunk = tuple(bool(v) for v in values[i:i + BITS])
+    if len(chunk) < BITS:
+      chunk += (False,) * (BITS - len(chunk))
+    b[i // BITS] = PACK_BITS[chunk]
+  buf.write(b)
+
+
+def _unpack_bitmap(buf, n):
+  bits = []
+  for b in buf.read((n + BITS - 1) // BITS):
+    bits.extend(UNPACK_BITS[b])
+  del bits[n:]
+  return bits
+
+
+def _skip_bitmap(buf, n):
+  buf.skip((n + BITS - 1) // BITS)
+
+
+def _array(code, values):
+  arr = model.float_array(code, values)
+  if not model.NATIVE_BIG_ENDIAN:
+    arr.byteswap()
+  return memoryview(arr).cast('B')
+
+
+def _unpack_array(buf, code, n):
+  arr = array.array(code)
+  arr.frombytes(buf.read(n * arr.itemsize))
+  if not model.NATIVE_BIG_ENDIAN:
+    arr.byteswap()
+  return arr
+
+
+def _unpack_numpy(buf, f_type, n):
+  if model.numpy is None:
+    raise ImportError('numpy is required to unpack columns as ndarrays')
+  return model.numpy.frombuffer(buf.read(n * f_type.PACKER.size), dtype=f_type.DTYPE)
+
+
+def _pack_strings(buf, values):
+  encoded = [ v.encode(model.STR_ENCODING) for v in values ]
+  offsets = [0]
+  end = 0
+  for b in encoded:
+    end += len(b)
+    offsets.append(end)
+  buf.write(_array(OFFSET_ARRAY_CODE, offsets))
+  buf.write(b''.join(encoded))
+
+
+def _unpack_strings(buf, n):
+  offsets = _unpack_array(buf, OFFSET_ARRAY_CODE, n + 1)
+  blob = buf.read(offsets[n])
+  return [ str(blob[offsets[i]:offsets[i + 1]], model.STR_ENCODING) for i in range(n) ]
+
+
+def _skip_strings(buf, n):
+  buf.skip(n * OFFSET_PACKER.size)
+  buf.skip(buf.unpack(OFFSET_PACKER)[0])
+
+
+def pack_column(buf, f_type, values):
+  code = model.packed_array_code(f_type)
+  if code is not None:
+    buf.write(_array(code, values))
+  elif isinstance(f_type, model.Boolean):
+    _pack_bitmap(buf, values)
+  elif isinstance(f_type, model.String):
+    _pack_strings(buf, values)
+  elif isinstance(f_type, model.Struct):
+    pack_struct_column(buf, f_type, values)
+  else:
+    for v in values:
+      f_type.pack(buf, v)
+
+
+def unpack_column(buf, f_type, n, projection=None):
+  code = model.packed_array_code(f_type)
+  if code is not None:
+    return _unpack_array(buf, code, n).tolist()
+  elif isinstance(f_type, model.Boolean):
+    return _unpack_bitmap(buf, n)
+  elif isinstance(f_type, model.String):
+    return _unpack_strings(buf, n)
+  elif isinstance(f_type, model.Struct):
+    return unpack_struct_column(buf, f_type, n, projection)
+  unpack = f_type.unpack
+  return [ unpack(buf) for i in range(n) ]
+
+
+def unpack_column_raw(buf, f_type, n, numpy=False):
+  # Like unpack_column, but numeric columns stay arrays (or ndarrays) and struct columns stay Columns
+  code = model.packed_array_code(f_type)
+  if code is not None:
+    return _unpack_numpy(buf, f_type, n) if numpy else _unpack_array(buf, code, n)
+  elif isinstance(f_type, model.Struct):
+    return unpack_struct_columns(buf, f_type, n, numpy)
+  return unpack_column(buf, f_type, n)
+
+
+def skip_column(buf, f_type, n):
+  if isinstance(f_type, model.FixedWidth) and not isinstance(f_type, model.Boolean):
+    buf.skip(n * f_type.PACKER.size)
+  elif isinstance(f_type, model.Boolean):
+    _skip_bitmap(buf, n)
+  elif isinstance(f_type, model.String):
+    _skip_strings(buf, n)
+  elif isinstance(f_type, model.Struct):
+    skip_struct_column(buf, f_type, n)
+  else:
+    skip = f_type.skip
+    for i in range(n):
+      skip(buf)
+
+
+def _fields(s_type):
+  return sorted(s_type.fields, key=lambda f: f.tag)
+
+
+def _unpack_present(buf, n):
+  present = _unpack_bitmap(buf, n)
+  if all(present):
+    return None, n
+  return present, sum(present)
+
+
+def pack_struct_column(buf, s_type, rows):
+  _pack_bitmap(buf, [ r is not None for r in rows ])
+  values = s_type.codec().values
+  rows = [ values(r) for r in rows if r is not None ]
+  for i, f in enumerate(_fields(s_type)):
+    pack_column(buf, f.type, [ r[i] for r in rows ])
+
+
+def unpack_struct_column(buf, s_type, n, projection=None):
+  present, count = _unpack_present(buf, n)
+  names = []
+  columns = []
+  for f in _fields(s_type):
+    if projection is None or f.name in projection:
+      names.append(f.name)
+      columns.append(unpack_column(buf, f.type, count, None if projection is None else projection[f.name]))
+    else:
+      skip_column(buf, f.type, count)
+
+  codec = s_type.codec()
+  if projection is None:
+    rows = [ codec.from_values(values) for values in zip(*columns) ] if len(columns) > 0 else []
+    rows.extend([ codec.new_object() for i in range(count - len(rows)) ])
+  else:
+    setters = [ codec.setter(name) for name in names ]
+    rows = []
+    for i in range(count):
+      obj = codec.new_object()
+      for set_value, column in zip(setters, columns):
+        set_value(obj, column[i])
+      rows.append(obj)
+  if present is None:
+    return rows
+  it = iter(rows)
+  return [ next(it) if p else None for p in present ]
+
+
+def unpack_struct_columns(buf, s_type, n, numpy=False):
+  present, count = _unpack_present(buf, n)
+  columns = {}
+  for f in _fields(s_type):
+    columns[f.name] = unpack_column_raw(buf, f.type, count, numpy)
+  return Columns(columns, present)
+
+
+def skip_struct_column(buf, s_type, n):
+  present, count = _unpack_present(buf, n)
+  for f in _fields(s_type):
+    skip_column(buf, f.type, count)
@@ -0,0 +1,87 @@
+import itertools
+import schemabuf.schema.model as model
+
+# Bulk conversion between struct objects and plain dicts (as produced by json.loads), one column at a time: each
+# field's values for all records are gathered, validated and converted together, nested structs (including those
+# in lists) are converted in a single recursive pass over all of them, and the objects are then built from their
+# columns without going through attribute validation. Keys that aren't fields are ignored and missing fields take
+# their default.
+
+
+def _converts(f_type):
+  # Whether values of f_type contain structs, and so need more than copying
+  return isinstance(f_type, model.Struct) or isinstance(f_type, model.List) and _converts(f_type.element_type)
+
+
+def _split(values, lengths):
+  result = []
+  start = 0
+  for n in lengths:
+    result.append(values[start:start + n])
+    start += n
+  return result
+
+
+def _restore_nones(items, converted):
+  # Puts None back wherever items held None, given the converted non-None items
+  if len(converted) == len(items):
+    return converted
+  converted = iter(converted)
+  return [ next(converted) if item is not None else None for item in items ]
+
+
+def _from_column(f_type, values, trusted):
+  if isinstance(f_type, model.Struct):
+    return from_dicts(f_type, values, trusted)
+  if isinstance(f_type, model.List) and _converts(f_type.element_type):
+    if not trusted:
+      model._assert_types(values, list, 'Value is not a list')
+    elements = _from_column(f_type.element_type, list(itertools.chain.from_iterable(values)), trusted)
+    return _split(elements, [ len(v) for v in values ])
+  if not trusted:
+    f_type.assert_valid_all(values)
+  if isinstance(f_type, model.List):
+    return [ list(v) for v in values ]
+  return values
+
+
+def from_dicts(s_type, dicts, trusted=False):
+  dicts = list(dicts)
+  present = [ d for d in dicts if d is not None ]
+  if not trusted:
+    model._assert_types(present, dict, 'Value is not a dict')
+  codec = s_type.codec()
+  columns = []
+  for f in codec._fields:
+    default = f.type.default()
+    columns.append(_from_column(f.type, [ d.get(f.name, default) for d in present ], trusted))
+  if len(columns) > 0:
+    objects = [ codec.from_values(values) for values in zip(*columns) ]
+  else:
+    objects = [ codec.new_object() for d in present ]
+  return _restore_nones(dicts, objects)
+
+
+def _to_column(f_type, values):
+  if isinstance(f_type, model.Struct):
+    return to_dicts(f_type, values)
+  if isinstance(f_type, model.List):
+    if _converts(f_type.element_type):
+      elements = _to_column(f_type.element_type, list(itertools.chain.from_iterable(values)))
+      return _split(elements, [ len(v) for v in values ])
+    return [ list(v) for v in values ]
+  return values
+
+
+def to_dicts(s_type, records):
+  records = list(records)
+  present = [ r for r in records if r is not None ]
+  codec = s_type.codec()
+  rows = [ codec.values(r) for r in present ]
+  names = [ f.name for f in codec._fields ]
+  columns = [ _to_column(f.type, [ row[i] for row in rows ]) for i, f in enumerate(codec._fields) ]
+  if len(columns) > 0:
+    dicts = [ dict(zip(names, values)) for values in zip(*columns) ]
+  else:
+    dicts = [ {} for r in present ]
+  return _restore_nones(records, dicts)
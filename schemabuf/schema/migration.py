@@ -0,0 +1,148 @@
+import schemabuf.schema.model as model
+import schemabuf.schema.codec as codec
+import schemabuf.schema.columnar as columnar
+
+# Scalar types that can be read as another type, and how the values are converted (None keeps them as they are)
+PROMOTIONS = {
+  (model.Int32, model.Int64): None,
+  (model.Int32, model.ZigZag): None,
+  (model.Int32, model.Double): float,
+  (model.Int64, model.ZigZag): None,
+  (model.ZigZag, model.Int64): None,
+  (model.Float, model.Double): None,
+}
+
+
+def _identity(value):
+  return value
+
+
+class MigrationCodec:
+
+  # Compiled decoder from messages written with one version of a schema (the writer) straight into objects of
+  # another (the reader). Fields are matched by tag: writer fields the reader doesn't have are skipped, reader
+  # fields the writer didn't have take their default, and matched fields are read with the writer's wire type and
+  # converted to the reader's (see PROMOTIONS; nested structs migrate recursively). Plans are cached per writer
+  # header like StructCodec's, so nothing is dispatched per field beyond what a plain decode does.
+  #
+  # migration(writer, reader) supplies the codecs for nested structs, so a registry can share them.
+
+  def __init__(self, writer, reader, migration=None):
+    self._writer = writer.codec()
+    self._reader = reader.codec()
+    self._migration = migration if migration is not None else MigrationCodec
+    # For each writer tag the reader also has: the reader's setter, and the reader for the value in the writer's
+    # wire type (or, for fixed-width fields, the conversion of the unpacked value)
+    self._targets = {}
+    for f in self._writer._fields:
+      r_field = self._reader._field_map.get(f.tag)
+      if r_field is None:
+        continue
+      w_type = self._writer._wire_types[f.tag]
+      if isinstance(w_type, model.FixedWidth):
+        read = _convert(w_type, r_field.type, f.name) or _identity
+      else:
+        read = self._resolve(w_type, r_field.type, f.name)
+      self._targets[f.tag] = self._reader.setter(r_field.name), read
+    self._decode_plans = {}
+
+  def _resolve(self, w_type, r_type, name):
+    # Function that reads a value written as w_type and returns it as r_type
+    if isinstance(w_type, model.Delimited):
+      unpack = self._resolve(w_type.type, r_type, name)
+      size = model.DELIMITER_PACKER.size
+
+      def unpack_delimited(buf):
+        buf.skip(size)
+        return unpack(buf)
+
+      return unpack_delimited
+    if isinstance(w_type, model.Struct) and isinstance(r_type, model.Struct):
+      if w_type.fingerprint() == r_type.fingerprint():
+        return r_type.codec().decode_value
+      return self._migration(w_type, r_type).decode_value
+    if isinstance(w_type, model.List) and isinstance(r_type, model.List):
+      return self._resolve_list(w_type, r_type, name)
+    convert = _convert(w_type, r_type, name)
+    if convert is None:
+      return w_type.unpack
+    unpack = w_type.unpack
+    return lambda buf: convert(unpack(buf))
+
+  def _resolve_list(self, w_type, r_type, name):
+    w_element = w_type.element_type
+    r_element = r_type.element_type
+    if w_type.columnar:
+      if w_element.fingerprint() != r_element.fingerprint():
+        raise TypeError('Cannot migrate the elements of columnar list field {}'.format(name))
+      return lambda buf: columnar.unpack_struct_column(buf, r_element, w_type._unpack_length(buf))
+    if not isinstance(w_element, (model.Struct, model.List)) and not isinstance(r_element, (model.Struct, model.List)):
+      # Read the whole list as written (a single array for fixed-width elements), then convert it
+      convert = _convert(w_element, r_element, name)
+      if convert is None:
+        return w_type.unpack
+      unpack = w_type.unpack
+      return lambda buf: list(map(convert, unpack(buf)))
+    unpack_element = self._resolve(w_element, r_element, name)
+
+    def unpack_list(buf):
+      arr_len = w_type._unpack_length(buf)
+      w_type._skip_index(buf, arr_len)
+      return [ unpack_element(buf) for i in range(arr_len) ]
+
+    return unpack_list
+
+  def _decode_plan(self, header):
+    fields = self._writer.header_fields(header)
+    steps = []
+    for packer, f in self._writer._group(fields):
+      if packer is not None:
+        targets = [ (i,) + self._targets[r.tag] for i, r in enumerate(f) if r.tag in self._targets ]
+        steps.append((packer, targets, None))
+      elif f.tag in self._targets:
+        set_value, unpack = self._targets[f.tag]
+        steps.append((None, set_value, unpack))
+      else:
+        steps.append((None, None, codec._skipper(self._writer._wire_types[f.tag])))
+    present = { self._reader._index[f.tag] for f in fields if f.tag in self._targets }
+    setters = self._reader._setters
+    defaults = [ (setters[i], default) for i, default in self._reader._defaults if i not in present ]
+    factories = [ (setters[i], factory) for i, factory in self._reader._factories if i not in present ]
+    return codec._cache(self._decode_plans, header, (steps, defaults, factories))
+
+  def decode_value(self, buf):
+    obj = object.__new__(self._reader.object_class)
+    header = self._writer.read_header(buf)
+    plan = self._decode_plans.get(header)
+    if plan is None:
+      plan = self._decode_plan(header)
+    steps, defaults, factories = plan
+    for set_value, default in defaults:
+      set_value(obj, default)
+    for set_value, factory in factories:
+      set_value(obj, factory())
+    for packer, setters, unpack in steps:
+      if packer is not None:
+        values = buf.unpack(packer)
+        for i, set_value, convert in setters:
+          set_value(obj, convert(values[i]))
+      elif setters is not None:
+        setters(obj, unpack(buf))
+      else:
+        unpack(buf)
+
+    return obj
+
+  def decode(self, buf):
+    # Decodes a whole message written by the writer schema from a ReadBuffer
+    return self.decode_value(self._writer.open_message(buf))
+
+
+def _convert(w_type, r_type, name):
+  # Conversion of a scalar written as w_type into r_type, or None when the value can be used as it is
+  if type(w_type) is type(r_type):
+    return None
+  key = (type(w_type), type(r_type))
+  if key not in PROMOTIONS:
+    raise TypeError('Cannot read field {} as {}: written as {}'.format(name, r_type.describe(), w_type.describe()))
+  return PROMOTIONS[key]
@@ -1,31 +1,79 @@
+import sys
+import math
+import array
+import itertools
 import struct
+import hashlib
+import weakref
+import uuid
+import schemabuf.schema.codec as codec
+import schemabuf.schema.view as view
+import schemabuf.schema.columnar as columnar
+import schemabuf.schema.patch as patch
+import schemabuf.schema.printer as printer
+import schemabuf.schema.dicts as dicts
+from schemabuf.buffer import WriteBuffer, ReadBuffer, IterReadBuffer, varint_size
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
 
 MAX_INT32 = 0x7fffffff
 MIN_INT32 = -0x80000000
 MAX_INT64 = 0x7fffffffffffffff
 MIN_INT64 = -0x8000000000000000
+MAX_UINT64 = 0xffffffffffffffff
+MAX_SHORT = 0x7fff
+LIST_LENGTH_ESCAPE = -1
+ZIGZAG_SHIFT = 63
+PACK_DELIMITER = '!I'
+PACK_INDEX = '!Q'
+INDEX_ARRAY_CODE = 'Q'
 MAX_FIELDS = 255
-SHORT_SIZE = 0x02
-INT32_SIZE = 0x04
-INT64_SIZE = 0x08
-FLOAT_SIZE = 0x04
-DOUBLE_SIZE = 0x08
 PACK_SHORT = '!h'
+PACK_BOOLEAN = '!?'
 PACK_INT32 = '!i'
-PACK_INT64 = '!l'
+PACK_INT64 = '!q'
 PACK_FLOAT = '!f'
 PACK_DOBULE = '!d'
 MAX_CONDENSED_TAG = 15
 UNCONDENSED_MASK = 0x88
 STR_ENCODING = 'utf-8'
 CODE_NULL = 0x00
+CODE_LENGTH_PREFIXED = 0xff
+CODE_STRING_REF = 0xfe
+SHORT_PACKER = struct.Struct(PACK_SHORT)
+DELIMITER_PACKER = struct.Struct(PACK_DELIMITER)
+INDEX_PACKER = struct.Struct(PACK_INDEX)
+NATIVE_BIG_ENDIAN = sys.byteorder == 'big'
+FINGERPRINT_SIZE = 0x08
+# Smallest magnitude that struct.pack('!f') refuses (and array('f') silently turns into inf)
+FLOAT32_OVERFLOW = 3.4028235677973366e+38
+FLOAT_ARRAY_CODE = 'f'
 
 
-def n_next(b_iter, c):
-  b = []
-  for i in range(c):
-    b.append(next(b_iter))
-  return bytes(b)
+def _assert_types(values, cls, message):
+  # Checks the type of a whole column of values, visiting each distinct type once
+  for t in set(map(type, values)):
+    if not issubclass(t, cls):
+      raise TypeError(message)
+
+
+def float_array(code, values):
+  # array.array(code, values), raising OverflowError like struct.pack would for a finite value that doesn't fit a
+  # float32 rather than storing it as inf
+  arr = array.array(code, values)
+  if code == FLOAT_ARRAY_CODE and (math.inf in arr or -math.inf in arr):
+    for packed, value in zip(arr, values):
+      if math.isinf(packed) and not math.isinf(value):
+        raise OverflowError('float too large to pack with f format')
+  return arr
+
+
+def _assert_range(values, low, high):
+  if len(values) > 0 and (min(values) < low or max(values) > high):
+    raise TypeError('Value out of range')
 
 
 class FieldType:
@@ -36,18 +84,81 @@ class FieldType:
   def assert_valid(self, data):
     pass
 
+  def assert_valid_all(self, values):
+    # Validates a column of values (a sequence); types override this with checks over the whole column
+    for data in values:
+      self.assert_valid(data)
+
   def print_value(self, data, pad_in=0, pad_size=2):
     pass
 
-  def serialise_value(self, data):
+  def pack(self, buf, data):
     pass
 
-  def deserialise_value(self, data):
+  def unpack(self, buf):
     pass
 
+  def unpack_view(self, buf):
+    return self.unpack(buf)
+
+  def skip(self, buf):
+    self.unpack(buf)
+
+  def skips_in_constant_time(self):
+    return False
+
+  def unpack_projected(self, buf, projection):
+    raise ValueError('Cannot project into {}'.format(type(self).__name__))
+
+  def describe(self):
+    return type(self).__name__
+
+  def encoded_size(self, data):
+    # Number of bytes pack writes for data outside a string table. Types without a cheaper rule measure a copy.
+    buf = WriteBuffer()
+    self.pack(buf, data)
+    return buf.offset
+
+  def serialise_value(self, data):
+    self.assert_valid(data)
+    buf = WriteBuffer()
+    self.pack(buf, data)
+    return list(buf.getbuffer())
+
+  def deserialise_value(self, b_iter):
+    return self.unpack(IterReadBuffer(b_iter))
+
+
+class FixedWidth(FieldType):
+
+  FORMAT = None
+  PACKER = None
+  ARRAY_CODE = None
+  DTYPE = None
+
+  def pack(self, buf, data):
+    buf.pack(self.PACKER, data)
+
+  def unpack(self, buf):
+    return buf.unpack(self.PACKER)[0]
+
+  def skip(self, buf):
+    buf.skip(self.PACKER.size)
+
+  def skips_in_constant_time(self):
+    return True
+
+  def encoded_size(self, data):
+    return self.PACKER.size
+
 
 class String(FieldType):
 
+  # Strings are written as a marker byte, a varint byte length and the UTF-8 bytes. 0xff never occurs in UTF-8, so
+  # the marker also distinguishes them from the original NUL-terminated strings, which can still be read.
+  # Inside a message with a string table (buf.strings) each string is instead a 0xfe marker and a varint index into
+  # the table.
+
   def default(self):
     return ''
 
@@ -55,6 +166,9 @@ class String(FieldType):
     if not isinstance(data, str):
       raise TypeError('Vaue is not a string')
 
+  def assert_valid_all(self, values):
+    _assert_types(values, str, 'Vaue is not a string')
+
   def print_value(self, data, pad_in=0, pad_size=2):
     self.assert_valid(data)
     esc_str = []
@@ -65,20 +179,52 @@ class String(FieldType):
     
     return '"{}"'.format(''.join(esc_str))
 
-  def serialise_value(self, data):
-    self.assert_valid()
-    return list(data.encode(STR_ENCODING)) + [CODE_NULL]
+  def pack(self, buf, data):
+    strings = buf.strings
+    if strings is not None:
+      i = strings.get(data)
+      if i is None:
+        i = len(strings)
+        strings[data] = i
+      buf.write_byte(CODE_STRING_REF)
+      buf.write_varint(i)
+      return
+    b = data.encode(STR_ENCODING)
+    buf.write_byte(CODE_LENGTH_PREFIXED)
+    buf.write_varint(len(b))
+    buf.write(b)
+
+  def unpack(self, buf):
+    c = buf.read_byte()
+    if c == CODE_LENGTH_PREFIXED:
+      return str(buf.read(buf.read_varint()), STR_ENCODING)
+    if c == CODE_STRING_REF:
+      return buf.strings[buf.read_varint()]
+    if c == CODE_NULL:
+      return ''
+    return (bytes([c]) + buf.read_until()).decode(STR_ENCODING)
+
+  def skip(self, buf):
+    c = buf.read_byte()
+    if c == CODE_LENGTH_PREFIXED:
+      buf.skip(buf.read_varint())
+    elif c == CODE_STRING_REF:
+      buf.read_varint()
+    elif c != CODE_NULL:
+      buf.skip_until()
+
+  def skips_in_constant_time(self):
+    return True
 
-  def deserialise_value(self, b_iter):
-    chars = []
-    c = next(b_iter)
-    while c != CODE_NULL:
-      chars.append(c)
-      c = next(b_iter)
-    return bytes(chars).decode(STR_ENCODING)
+  def encoded_size(self, data):
+    n = len(data) if data.isascii() else len(data.encode(STR_ENCODING))
+    return 1 + varint_size(n) + n
 
 
-class Boolean(FieldType):
+class Boolean(FixedWidth):
+
+  FORMAT = '?'
+  PACKER = struct.Struct(PACK_BOOLEAN)
   
   def default(self):
     return False
@@ -86,20 +232,21 @@ class Boolean(FieldType):
   def assert_valid(self, data):
     if not isinstance(data, bool):
       raise TypeError('Value is not a boolean')
+
+  def assert_valid_all(self, values):
+    _assert_types(values, bool, 'Value is not a boolean')
   
   def print_value(self, data, pad_in=0, pad_size=2):
     self.assert_valid(data)
     return str(data)
 
-  def serialise_value(self, data):
-    self.assert_valid(data)
-    return [0x01] if data else [0x00]
-
-  def deserialise_value(self, b_iter):
-    return next(b_iter) == 0x01
 
+class Int32(FixedWidth):
 
-class Int32(FieldType):
+  FORMAT = 'i'
+  PACKER = struct.Struct(PACK_INT32)
+  ARRAY_CODE = 'i'
+  DTYPE = '>i4'
 
   def default(self):
     return 0
@@ -110,19 +257,21 @@ class Int32(FieldType):
     if data > MAX_INT32 or data < MIN_INT32:
       raise TypeError('Value out of range')
 
+  def assert_valid_all(self, values):
+    _assert_types(values, int, 'Value is not an int')
+    _assert_range(values, MIN_INT32, MAX_INT32)
+
   def print_value(self, data, pad_in=0, pad_size=2):
     self.assert_valid(data)
     return 'Int32( {} )'.format(data)
 
-  def serialise_value(self, data):
-    self.assert_valid(data)
-    return list(struct.pack(PACK_INT32, data))
-
-  def deserialise_value(self, b_iter):
-    return struct.unpack(PACK_INT32, n_next(b_iter, INT32_SIZE))[0]
 
+class Int64(FixedWidth):
 
-class Int64(FieldType):
+  FORMAT = 'q'
+  PACKER = struct.Struct(PACK_INT64)
+  ARRAY_CODE = 'q'
+  DTYPE = '>i8'
 
   def default(self):
     return 0
@@ -133,21 +282,21 @@ class Int64(FieldType):
     if data > MAX_INT64 or data < MIN_INT64:
       raise TypeError('Value out of range')
 
+  def assert_valid_all(self, values):
+    _assert_types(values, int, 'Value is not an int')
+    _assert_range(values, MIN_INT64, MAX_INT64)
+
   def print_value(self, data, pad_in=0, pad_size=2):
-    if not self.valid(data):
-      raise TypeError()
+    self.assert_valid(data)
     return 'Int64( {} )'.format(data)
 
-  def serialise_value(self, data):
-    if not self.valid(data):
-      raise TypeError()
-    return list(struct.pack(PACK_INT64, data))
-
-  def deserialise_value(self, b_iter):
-    return struct.unpack(PACK_INT64, n_next(b_iter, INT64_SIZE))[0]
 
+class Float(FixedWidth):
 
-class Float(FieldType):
+  FORMAT = 'f'
+  PACKER = struct.Struct(PACK_FLOAT)
+  ARRAY_CODE = 'f'
+  DTYPE = '>f4'
 
   def default(self):
     return 0.0
@@ -155,20 +304,27 @@ class Float(FieldType):
   def assert_valid(self, data):
     if not isinstance(data, float):
       raise TypeError('Value is not a float')
+    if abs(data) >= FLOAT32_OVERFLOW and not math.isinf(data):
+      raise TypeError('Value out of range')
+
+  def assert_valid_all(self, values):
+    _assert_types(values, float, 'Value is not a float')
+    try:
+      float_array(FLOAT_ARRAY_CODE, values)
+    except OverflowError:
+      raise TypeError('Value out of range')
 
   def print_value(self, data, pad_in=0, pad_size=2):
     self.assert_valid(data)
     return 'Float( {} )'.format(data)
-  
-  def serialise_value(self, data):
-    self.assert_valid(data)
-    return list(struct.pack(PACK_FLOAT, data))
 
-  def deserialise_value(self, b_iter):
-    return struct.unpack(PACK_FLOAT, n_next(b_iter, FLOAT_SIZE))[0]
 
+class Double(FixedWidth):
 
-class Double(FieldType):
+  FORMAT = 'd'
+  PACKER = struct.Struct(PACK_DOBULE)
+  ARRAY_CODE = 'd'
+  DTYPE = '>f8'
 
   def default(self):
     return 0.0
@@ -177,25 +333,122 @@ class Double(FieldType):
     if not isinstance(data, float):
       raise TypeError('Value is not a double')
 
+  def assert_valid_all(self, values):
+    _assert_types(values, float, 'Value is not a double')
+
   def print_value(self, data, pad_in=0, pad_size=2):
     self.assert_valid(data)
     return 'Double( {} )'.format(data)
-  
-  def serialise_value(self, data):
+
+
+class VarInt(FieldType):
+
+  # Unsigned integer written as a base-128 varint, so small values take a single byte
+
+  def default(self):
+    return 0
+
+  def assert_valid(self, data):
+    if not isinstance(data, int):
+      raise TypeError('Value is not an int')
+    if data > MAX_UINT64 or data < 0:
+      raise TypeError('Value out of range')
+
+  def assert_valid_all(self, values):
+    _assert_types(values, int, 'Value is not an int')
+    _assert_range(values, 0, MAX_UINT64)
+
+  def print_value(self, data, pad_in=0, pad_size=2):
     self.assert_valid(data)
-    return list(struct.pack(PACK_DOBULE, data))
+    return 'VarInt( {} )'.format(data)
 
-  def deserialise_value(self, b_iter):
-    return struct.unpack(PACK_DOBULE, n_next(b_iter, DOUBLE_SIZE))[0]
+  def pack(self, buf, data):
+    buf.write_varint(data)
+
+  def unpack(self, buf):
+    return buf.read_varint()
+
+  def skip(self, buf):
+    buf.read_varint()
+
+  def skips_in_constant_time(self):
+    return True
+
+  def encoded_size(self, data):
+    return varint_size(data)
+
+
+class ZigZag(FieldType):
+
+  # Signed 64-bit integer, zigzag mapped onto a varint so that small negative values also stay short
+
+  def default(self):
+    return 0
+
+  def assert_valid(self, data):
+    if not isinstance(data, int):
+      raise TypeError('Value is not an int')
+    if data > MAX_INT64 or data < MIN_INT64:
+      raise TypeError('Value out of range')
+
+  def assert_valid_all(self, values):
+    _assert_types(values, int, 'Value is not an int')
+    _assert_range(values, MIN_INT64, MAX_INT64)
+
+  def print_value(self, data, pad_in=0, pad_size=2):
+    self.assert_valid(data)
+    return 'ZigZag( {} )'.format(data)
+
+  def pack(self, buf, data):
+    buf.write_varint((data << 1) ^ (data >> ZIGZAG_SHIFT))
+
+  def unpack(self, buf):
+    z = buf.read_varint()
+    return (z >> 1) ^ -(z & 1)
+
+  def skip(self, buf):
+    buf.read_varint()
+
+  def skips_in_constant_time(self):
+    return True
+
+  def encoded_size(self, data):
+    return varint_size((data << 1) ^ (data >> ZIGZAG_SHIFT))
+
+
+def value_sizer(f_type):
+  # Function giving the encoded size of a value of f_type nested in a message. Unlike Struct.encoded_size, a nested
+  # struct never has a string table of its own.
+  if isinstance(f_type, Struct):
+    return f_type.codec().size_value
+  return f_type.encoded_size
+
+
+def packed_array_code(f_type):
+  code = getattr(f_type, 'ARRAY_CODE', None)
+  if code is None or array.array(code).itemsize != f_type.PACKER.size:
+    return None
+  return code
 
 
 class List(FieldType):
 
-  def __init__(self, element_type):
+  def __init__(self, element_type, varint_length=False, indexed=False, columnar=False):
     if isinstance(element_type, type) and issubclass(element_type, FieldType):
       self.element_type = element_type()
     else:
       self.element_type = element_type
+    self.varint_length = varint_length
+    # Columnar lists of structs write each field as its own column (see schemabuf.schema.columnar)
+    if columnar and not isinstance(self.element_type, Struct):
+      raise TypeError('Columnar lists need a Struct element type')
+    self.columnar = columnar
+    # Indexed lists write a table of element offsets (plus the end offset) between the length and the elements, so
+    # any element can be found in O(1). Fixed-width elements can already be found by arithmetic.
+    self.indexed = indexed and not columnar and not isinstance(self.element_type, FixedWidth)
+    # Fixed-width numeric elements are laid out back to back in network order, so the whole list can be packed
+    # and unpacked as a single array
+    self._array_code = packed_array_code(self.element_type)
 
   def default(self):
     return []
@@ -206,34 +459,209 @@ class List(FieldType):
     for e in data:
       self.element_type.assert_valid(e)
 
+  def assert_valid_all(self, values):
+    _assert_types(values, list, 'Value is not a list')
+    self.element_type.assert_valid_all(list(itertools.chain.from_iterable(values)))
+
   def print_value(self, data, pad_in=0, pad_size=2):
-    self.assert_valid(data)
-    elements = []
-    for e in data:
-      elements.append(self.element_type.print_value(e, pad_in=pad_in+pad_size, pad_size=pad_size))
-    if len(elements) == 0:
-      return '[]'
-    elif len(elements) == 1:
-      return '[ {} ]'.format(''.join(elements))
+    # Elements validate themselves as they are printed
+    return printer.format_value(self, data, pad_in, pad_size)
+
+  def _pack_length(self, buf, arr_len):
+    # By default the length is a short, matching the original format. Longer lists write an escape short followed
+    # by a varint so they can still be encoded; varint_length lists always use a varint.
+    if self.varint_length:
+      buf.write_varint(arr_len)
+    elif arr_len > MAX_SHORT:
+      buf.pack(SHORT_PACKER, LIST_LENGTH_ESCAPE)
+      buf.write_varint(arr_len)
     else:
-      pad_str = ' ' * (pad_in + pad_size)
-      return '[\n{}{}\n{}]'.format(pad_str, ',\n{}'.format(pad_str).join(elements), ' ' * pad_in)
-
-  def serialise_value(self, data):
-    self.assert_valid(data)
-    arr = list(struct.pack(PACK_SHORT, len(data)))
-    for i in data:
-      arr.extend(self.element_type.serialise_value(i))
-    return arr
-
-  def deserialise_value(self, b_iter):
-    arr_len = struct.unpack(PACK_SHORT, n_next(b_iter, SHORT_SIZE))[0]
-    arr = []
+      buf.pack(SHORT_PACKER, arr_len)
+
+  def _length_size(self, arr_len):
+    if self.varint_length:
+      return varint_size(arr_len)
+    elif arr_len > MAX_SHORT:
+      return SHORT_PACKER.size + varint_size(arr_len)
+    return SHORT_PACKER.size
+
+  def _unpack_length(self, buf):
+    if self.varint_length:
+      return buf.read_varint()
+    arr_len = buf.unpack(SHORT_PACKER)[0]
+    if arr_len == LIST_LENGTH_ESCAPE:
+      return buf.read_varint()
+    return arr_len
+
+  def pack(self, buf, data):
+    self._pack_length(buf, len(data))
+    if self.columnar:
+      columnar.pack_struct_column(buf, self.element_type, data)
+      return
+    if self._array_code is not None:
+      arr = float_array(self._array_code, data)
+      if not NATIVE_BIG_ENDIAN:
+        arr.byteswap()
+      buf.write(memoryview(arr).cast('B'))
+      return
+    pack_element = self.element_type.pack
+    if self.indexed:
+      self._pack_indexed(buf, data, pack_element)
+      return
+    for e in data:
+      pack_element(buf, e)
+
+  def encoded_size(self, data):
+    if self.columnar:
+      return super().encoded_size(data)
+    size = self._length_size(len(data))
+    if self.indexed:
+      size += (len(data) + 1) * INDEX_PACKER.size
+    if isinstance(self.element_type, FixedWidth):
+      return size + len(data) * self.element_type.PACKER.size
+    element_size = value_sizer(self.element_type)
+    return size + sum([ element_size(e) for e in data ])
+
+  def _pack_indexed(self, buf, data, pack_element):
+    table = buf.reserve((len(data) + 1) * INDEX_PACKER.size)
+    start = buf.offset
+    offsets = array.array(INDEX_ARRAY_CODE)
+    for e in data:
+      offsets.append(buf.offset - start)
+      pack_element(buf, e)
+    offsets.append(buf.offset - start)
+    if not NATIVE_BIG_ENDIAN:
+      offsets.byteswap()
+    buf.write_at(table, memoryview(offsets).cast('B'))
+
+  def _skip_index(self, buf, arr_len):
+    if self.indexed:
+      buf.skip((arr_len + 1) * INDEX_PACKER.size)
+
+  def unpack(self, buf):
+    arr_len = self._unpack_length(buf)
+    if self.columnar:
+      return columnar.unpack_struct_column(buf, self.element_type, arr_len)
+    if self._array_code is not None:
+      return self._unpack_array(buf, arr_len).tolist()
+    self._skip_index(buf, arr_len)
+    unpack_element = self.element_type.unpack
+    return [ unpack_element(buf) for i in range(arr_len) ]
+
+  def unpack_view(self, buf):
+    if self.columnar or isinstance(self.element_type, FixedWidth):
+      return self.unpack(buf)
+    arr_len = self._unpack_length(buf)
+    if self.indexed:
+      index = buf.offset
+      buf.skip((arr_len + 1) * INDEX_PACKER.size)
+      return view.ListView(self.element_type, buf, arr_len, index=index)
+    return view.ListView(self.element_type, buf, arr_len)
+
+  def skip(self, buf):
+    arr_len = self._unpack_length(buf)
+    if self.columnar:
+      columnar.skip_struct_column(buf, self.element_type, arr_len)
+      return
+    if isinstance(self.element_type, FixedWidth):
+      buf.skip(arr_len * self.element_type.PACKER.size)
+      return
+    if self.indexed:
+      buf.skip(arr_len * INDEX_PACKER.size)
+      buf.skip(buf.unpack(INDEX_PACKER)[0])
+      return
+    skip_element = self.element_type.skip
     for i in range(arr_len):
-      arr.append(self.element_type.deserialise_value(b_iter))
-    
+      skip_element(buf)
+
+  def skips_in_constant_time(self):
+    return self.indexed or isinstance(self.element_type, FixedWidth)
+
+  def describe(self):
+    options = ''.join([
+      ',varint' if self.varint_length else '',
+      ',indexed' if self.indexed else '',
+      ',columnar' if self.columnar else ''
+    ])
+    return 'List<{}{}>'.format(self.element_type.describe(), options)
+
+  def unpack_projected(self, buf, projection):
+    arr_len = self._unpack_length(buf)
+    if self.columnar:
+      return columnar.unpack_struct_column(buf, self.element_type, arr_len, projection)
+    self._skip_index(buf, arr_len)
+    unpack_element = self.element_type.unpack_projected
+    return [ unpack_element(buf, projection) for i in range(arr_len) ]
+
+  def _unpack_array(self, buf, arr_len):
+    arr = array.array(self._array_code)
+    arr.frombytes(buf.read(arr_len * arr.itemsize))
+    if not NATIVE_BIG_ENDIAN:
+      arr.byteswap()
     return arr
 
+  def unpack_array(self, buf):
+    if self._array_code is None:
+      raise TypeError('List elements are not a packed numeric type')
+    return self._unpack_array(buf, self._unpack_length(buf))
+
+  def unpack_columns(self, buf, numpy=False):
+    # Decodes a columnar list into a Columns mapping of field name to column, without building row objects
+    if not self.columnar:
+      raise TypeError('List is not columnar')
+    return columnar.unpack_struct_columns(buf, self.element_type, self._unpack_length(buf), numpy)
+
+  def unpack_column_form(self, buf, numpy=False):
+    # Columns of a columnar list, or the array (an ndarray with numpy=True) of a fixed-width numeric list
+    if self.columnar:
+      return self.unpack_columns(buf, numpy)
+    if self._array_code is None:
+      raise TypeError('List has no column form: {}'.format(self.describe()))
+    return self.unpack_numpy(buf) if numpy else self.unpack_array(buf)
+
+  def unpack_numpy(self, buf):
+    if self._array_code is None:
+      raise TypeError('List elements are not a packed numeric type')
+    if numpy is None:
+      raise ImportError('numpy is required to unpack a list as an ndarray')
+    arr_len = self._unpack_length(buf)
+    return numpy.frombuffer(buf.read(arr_len * self.element_type.PACKER.size), dtype=self.element_type.DTYPE)
+
+
+class Delimited(FieldType):
+
+  # Wire wrapper used by skippable structs: prefixes a value with its encoded length so it can be skipped without
+  # being parsed
+
+  def __init__(self, f_type):
+    self.type = f_type
+
+  def pack(self, buf, data):
+    offset = buf.reserve(DELIMITER_PACKER.size)
+    self.type.pack(buf, data)
+    buf.pack_at(DELIMITER_PACKER, offset, buf.offset - offset - DELIMITER_PACKER.size)
+
+  def unpack(self, buf):
+    buf.skip(DELIMITER_PACKER.size)
+    return self.type.unpack(buf)
+
+  def unpack_view(self, buf):
+    buf.skip(DELIMITER_PACKER.size)
+    return self.type.unpack_view(buf)
+
+  def unpack_projected(self, buf, projection):
+    buf.skip(DELIMITER_PACKER.size)
+    return self.type.unpack_projected(buf, projection)
+
+  def skip(self, buf):
+    buf.skip(buf.unpack(DELIMITER_PACKER)[0])
+
+  def encoded_size(self, data):
+    return DELIMITER_PACKER.size + value_sizer(self.type)(data)
+
+  def skips_in_constant_time(self):
+    return True
+
 
 class Field:
 
@@ -245,95 +673,197 @@ class Field:
 
 class StructObject:
 
-  def __init__(self, struct):
-    self._struct = struct
-    for field in struct.fields:
-      setattr(self, field.name, field.type.default())
+  # Base of the class each Struct generates for its objects (see StructCodec), which adds a slot per field, the
+  # Struct itself and each field's validator. StructObject(s_type) still works and builds an instance of it.
+
+  __slots__ = ()
+  _struct = None
+  _validators = {}
+
+  def __new__(cls, struct=None):
+    return (struct if struct is not None else cls._struct).codec().new_object()
+
+  def __init__(self, struct=None):
+    pass
 
   def __setattr__(self, name, value):
-    if hasattr(self, '_struct'):
-      field = [ f for f in self._struct.fields if f.name == name ]
-      if len(field) > 0:
-        field[0].type.assert_valid(value)
+    validate = self._validators.get(name)
+    if validate is not None:
+      validate(value)
 
-    super().__setattr__(name, value)
+    object.__setattr__(self, name, value)
+
+  def __reduce__(self):
+    return _restore_object, (self._struct, self._struct.codec().values(self))
 
   def __str__(self):
     return self._struct.print_value(self)
 
 
+def _restore_object(s_type, values):
+  return s_type.codec().from_values(values)
+
+
+# Structs that have been pickled or unpickled in this process, by the unique token each one is pickled with.
+# Unpickling resolves to the instance the token names, so objects that come back from another process still belong
+# to the caller's schema, and structs of the same shape are never mixed up.
+_structs = weakref.WeakValueDictionary()
+
+
+def _restore_struct(token, fields, skippable, intern_strings, presence_bitmap):
+  s_type = _structs.get(token)
+  if s_type is None:
+    s_type = Struct(fields, skippable=skippable, intern_strings=intern_strings, presence_bitmap=presence_bitmap)
+    s_type._token = token
+    _structs[token] = s_type
+  return s_type
+
+
 class Struct(FieldType):
 
-  def __init__(self, fields):
+  def __init__(self, fields, skippable=False, intern_strings=False, presence_bitmap=False):
+    if len(fields) > MAX_FIELDS:
+      raise TypeError('Too many fields on object')
     self.fields = fields
+    self.skippable = skippable
+    # When this struct is the root of a message, all of the message's strings are written once to a string table
+    # ahead of the struct and referenced by index
+    self.intern_strings = intern_strings
+    # Write which fields are present as a fixed-size bitmap indexed by tag rather than a count and a list of tags,
+    # which is smaller whenever more than one field is set
+    self.presence_bitmap = presence_bitmap
+    self._codec = None
+    self._fingerprint = None
+    self._token = None
 
   def default(self):
     return None
 
+  def _assert_type(self, data):
+    if not isinstance(data, StructObject) or data._struct != self:
+      raise TypeError('Value is wrong type')
+
   def assert_valid(self, data):
-    if len(self.fields) > MAX_FIELDS:
-      raise TypeError('Too many fields on object')
+    # Validates data and everything nested in it, visiting each value once
     if data is None:
       return
-    if not isinstance(data, StructObject) or data._struct != self:
-      raise TypeError('Value is wrong type')
+    self._assert_type(data)
     for field in self.fields:
       if not hasattr(data, field.name):
-        raise TypeError('Missing field: {}').format(field.name)
+        raise TypeError('Missing field: {}'.format(field.name))
       field.type.assert_valid(getattr(data, field.name))
     return True
 
   def print_value(self, data, pad_in=0, pad_size=2):
-    self.assert_valid(data)
-    if data is None:
-      return 'None'
-    elements = []
-    for field in self.fields:
-      elements.append('{}: {}'.format(
-        field.name,
-        field.type.print_value(getattr(data, field.name), pad_in=pad_in+pad_size, pad_size=pad_size)
-      ))
-    if len(elements) == 0:
-      return '{}'
-    else:
-      pad_str = ' ' * (pad_in + pad_size)
-      return '{}\n{}{}\n{}{}'.format('{', pad_str, ',\n{}'.format(pad_str).join(elements), ' ' * pad_in, '}')
-
-  def serialise_value(self, data):
-    self.assert_valid(data)
-    if data is None:
-      return b''
-    b = []
-    # Append tags
-    fields = [ f for f in self.fields if getattr(data, f.name) != f.type.default() ]
-    fields.sort(key=lambda f: f.tag)
-    b.append(len(fields))
-    make_tag = []
-    for f in fields:
-      b.append(f.tag - 1)
-    # Append values
-    for f in fields:
-      b.extend(f.type.serialise_value(getattr(data, f.name)))
-    
-    return b
-
-  def serialise(self, data):
-    return bytes(self.serialise_value(data))
-
-  def deserialise_value(self, b_iter):
-    data = self.create()
-    field_map = { f.tag: f for f in self.fields }
-    field_count = int(next(b_iter))
-    field_tags = list(n_next(b_iter, field_count))
-    
-    for tag in field_tags:
-      field = field_map[tag + 1]
-      setattr(data, field.name, field.type.deserialise_value(b_iter))
-
-    return data
-
-  def deserialise(self, data):
-    return self.deserialise_value(iter(data))
+    # Fields validate themselves as they are printed
+    return printer.format_value(self, data, pad_in, pad_size)
+
+  def write_value(self, out, data, max_depth=None, max_elements=None, pad_size=2):
+    # Streams the print_value text of data (or a lazy view of it) to out, optionally cut off at a nesting depth and
+    # a number of elements per list
+    printer.ValuePrinter(out, pad_size, max_depth, max_elements).write(self, data)
+
+  def pack(self, buf, data):
+    self.codec().encode_value(buf, data)
+
+  def unpack(self, buf):
+    return self.codec().decode_value(buf)
+
+  def unpack_view(self, buf):
+    return view.StructView(self, buf)
+
+  def skip(self, buf):
+    self.codec().skip_value(buf)
+
+  def unpack_projected(self, buf, projection):
+    return self.codec().decode_projected(buf, projection)
+
+  def serialise(self, data, trusted=False, profile=None):
+    # trusted skips validation, for data known to be valid such as objects straight from the decoder. A
+    # schemabuf.profile.Profile records where the encoding time and bytes go.
+    if profile is not None:
+      return profile.encode(self, data, trusted)
+    return self.codec().encode(data, trusted)
+
+  def serialise_into(self, data, buffer, offset=0, trusted=False):
+    # Writes the message for data into buffer at offset (see WriteBuffer.wrap) and returns the offset just past it
+    return self.codec().encode_into(data, buffer, offset, trusted)
+
+  def encoded_size(self, data):
+    # Size of the message serialise would produce, including any string table
+    return self.codec().message_size(data)
+
+  def pack_message(self, buf, data):
+    self.codec().encode_message(buf, data)
+
+  def open_message(self, buf):
+    return self.codec().open_message(buf)
+
+  def deserialise(self, data, lazy=False, fields=None, profile=None):
+    if profile is not None:
+      if lazy or fields is not None:
+        raise ValueError('Only full decoding can be profiled')
+      return profile.decode(self, data)
+    if lazy:
+      return self.unpack_view(self.open_message(ReadBuffer(data)))
+    if fields is not None:
+      return self.codec().decode_projected(self.open_message(ReadBuffer(data)), self.codec().projection(fields))
+    return self.codec().decode(data)
+
+  def deserialise_columns(self, data, field, numpy=False):
+    # Decodes the list field at a (dotted) path of a message straight into columns: a Columns mapping for columnar
+    # lists of structs, or an array (an ndarray with numpy=True) for fixed-width numeric lists. Nothing else in the
+    # message is decoded.
+    return self.deserialise(data, lazy=True).columns(field, numpy)
+
+  def from_dicts(self, records, trusted=False):
+    # Builds objects from plain dicts (e.g. parsed JSON), validating each field's values once as a column
+    return dicts.from_dicts(self, records, trusted)
+
+  def to_dicts(self, records):
+    return dicts.to_dicts(self, records)
+
+  def diff(self, old, new):
+    # Encodes the changes that turn old into new. Unchanged fields and list elements cost nothing.
+    self.assert_valid(new)
+    return patch.diff(self, old, new)
+
+  def apply_patch(self, obj, data):
+    # Applies a patch from diff to obj in place (including nested structs and lists) and returns it
+    return patch.apply_patch(self, obj, data)
+
+  def describe(self):
+    fields = ';'.join([ '{}:{}:{}'.format(f.tag, f.name, f.type.describe()) for f in sorted(self.fields, key=lambda f: f.tag) ])
+    options = ''.join([
+      '[skippable]' if self.skippable else '',
+      '[intern]' if self.intern_strings else '',
+      '[bitmap]' if self.presence_bitmap else ''
+    ])
+    return 'Struct{}{{{}}}'.format(options, fields)
+
+  def fingerprint(self):
+    # Stable identifier of the schema's shape and wire options
+    if self._fingerprint is None:
+      self._fingerprint = hashlib.sha256(self.describe().encode(STR_ENCODING)).digest()[:FINGERPRINT_SIZE]
+    return self._fingerprint
+
+  def __reduce__(self):
+    if self._token is None:
+      self._token = uuid.uuid4().bytes
+      _structs[self._token] = self
+    return _restore_struct, (self._token, self.fields, self.skippable, self.intern_strings, self.presence_bitmap)
+
+  def __copy__(self):
+    return self
+
+  def __deepcopy__(self, memo):
+    # Schemas are shared, not copied, so copies of objects still belong to the same Struct
+    return self
+
+  def codec(self):
+    if self._codec is None:
+      self._codec = codec.StructCodec(self)
+    return self._codec
 
   def create(self):
-    return StructObject(self)
+    return self.codec().new_object()
@@ -0,0 +1,136 @@
+import struct
+import schemabuf.schema.model as model
+from schemabuf.buffer import WriteBuffer, ReadBuffer
+
+# A struct patch is a varint count of changed fields followed by, for each one, its tag byte, an op byte and the
+# op's payload:
+# - OP_SET: the new value, packed with the field's type
+# - OP_CLEAR: nothing; the value becomes None (a struct that was removed)
+# - OP_PATCH: a nested struct patch to apply to the current value
+# - OP_LIST: the new length as a varint, a varint count of changed elements and, for each one, its index as a
+#   varint, an op byte and that op's payload. Elements past the new length are dropped.
+
+OP_SET = 0x00
+OP_CLEAR = 0x01
+OP_PATCH = 0x02
+OP_LIST = 0x03
+
+
+def _diff_value(f_type, old, new):
+  # Returns (op, payload) describing how to turn old into new, or None if they are equal
+  if isinstance(f_type, model.Struct):
+    if old is None or new is None:
+      if old is new:
+        return None
+      return (OP_CLEAR, None) if new is None else (OP_SET, new)
+    changes = _diff_struct(f_type, old, new)
+    return (OP_PATCH, changes) if len(changes) > 0 else None
+  if isinstance(f_type, model.List):
+    return _diff_list(f_type, old, new)
+  return (OP_SET, new) if old != new else None
+
+
+def _diff_list(f_type, old, new):
+  element_type = f_type.element_type
+  changes = []
+  for i, value in enumerate(new):
+    if i < len(old):
+      change = _diff_value(element_type, old[i], value)
+    else:
+      change = (OP_CLEAR, None) if value is None else (OP_SET, value)
+    if change is not None:
+      changes.append((i,) + change)
+  if len(changes) == 0 and len(old) == len(new):
+    return None
+  if len(changes) == len(new) and len(new) > 0 and (f_type.columnar or all([ v is not None for v in new ])):
+    # Every element changed, so the whole list is no larger. Only columnar lists can pack None elements.
+    return OP_SET, new
+  return OP_LIST, (len(new), changes)
+
+
+def _diff_struct(s_type, old, new):
+  codec = s_type.codec()
+  changes = []
+  for f, old_value, new_value in zip(codec._fields, codec.values(old), codec.values(new)):
+    change = _diff_value(f.type, old_value, new_value)
+    if change is not None:
+      changes.append((f,) + change)
+  return changes
+
+
+def _write_change(buf, f_type, op, payload):
+  buf.write_byte(op)
+  if op == OP_SET:
+    f_type.pack(buf, payload)
+  elif op == OP_PATCH:
+    _write_struct(buf, payload)
+  elif op == OP_LIST:
+    length, changes = payload
+    buf.write_varint(length)
+    buf.write_varint(len(changes))
+    for i, element_op, element_payload in changes:
+      buf.write_varint(i)
+      _write_change(buf, f_type.element_type, element_op, element_payload)
+
+
+def _write_struct(buf, changes):
+  buf.write_varint(len(changes))
+  for f, op, payload in changes:
+    buf.write_byte(f.tag)
+    _write_change(buf, f.type, op, payload)
+
+
+def _apply_change(buf, f_type, current):
+  op = buf.read_byte()
+  if op == OP_SET:
+    return f_type.unpack(buf)
+  elif op == OP_CLEAR:
+    return None
+  elif op == OP_PATCH:
+    if not isinstance(f_type, model.Struct) or current is None:
+      raise ValueError('Patch does not match struct')
+    return _apply_struct(buf, f_type, current)
+  elif op == OP_LIST:
+    if not isinstance(f_type, model.List):
+      raise ValueError('Patch does not match struct')
+    length = buf.read_varint()
+    if length > len(current) + len(buf.data) - buf.offset:
+      # Each added element needs at least its index and op byte in the patch
+      raise ValueError('Patch is malformed')
+    del current[length:]
+    current.extend([None] * (length - len(current)))
+    for j in range(buf.read_varint()):
+      i = buf.read_varint()
+      if i >= length:
+        raise ValueError('Patch is malformed')
+      current[i] = _apply_change(buf, f_type.element_type, current[i])
+    return current
+  raise ValueError('Unknown patch op: {}'.format(op))
+
+
+def _apply_struct(buf, s_type, obj):
+  codec = s_type.codec()
+  for j in range(buf.read_varint()):
+    field = codec._field_map.get(buf.read_byte())
+    if field is None:
+      raise ValueError('Patch does not match struct')
+    codec.setter(field.name)(obj, _apply_change(buf, field.type, getattr(obj, field.name)))
+  return obj
+
+
+def diff(s_type, old, new):
+  buf = WriteBuffer()
+  _write_struct(buf, _diff_struct(s_type, old, new))
+  return buf.getvalue()
+
+
+def apply_patch(s_type, obj, patch):
+  # A malformed patch raises ValueError, possibly after part of it has been applied
+  buf = ReadBuffer(patch)
+  try:
+    _apply_struct(buf, s_type, obj)
+  except (EOFError, IndexError, struct.error):
+    raise ValueError('Patch is truncated')
+  if buf.offset != len(patch):
+    raise ValueError('Patch has trailing data')
+  return obj
@@ -0,0 +1,86 @@
+import io
+import itertools
+import schemabuf.schema.model as model
+import schemabuf.schema.view as view
+
+ELLIPSIS = '...'
+
+
+class ValuePrinter:
+
+  # Writes the print_value text of a value to a file-like object piece by piece, so nothing larger than a single
+  # scalar is ever built in memory. Structs nested deeper than max_depth are written as '{ ... }' and lists as
+  # '[ ... n elements ]'; lists longer than max_elements are cut off after that many elements. Values can also be
+  # lazy views (Struct.deserialise(data, lazy=True)), in which case only the parts that are written get decoded.
+
+  def __init__(self, out, pad_size=2, max_depth=None, max_elements=None):
+    self._out = out
+    self._pad_size = pad_size
+    self._max_depth = max_depth
+    self._max_elements = max_elements
+
+  def write(self, f_type, data, pad_in=0, depth=0):
+    if isinstance(f_type, model.Struct):
+      self._write_struct(f_type, data, pad_in, depth)
+    elif isinstance(f_type, model.List):
+      self._write_list(f_type, data, pad_in, depth)
+    else:
+      self._out.write(f_type.print_value(data, pad_in=pad_in, pad_size=self._pad_size))
+
+  def _too_deep(self, depth):
+    return self._max_depth is not None and depth >= self._max_depth
+
+  def _write_struct(self, s_type, data, pad_in, depth):
+    out = self._out
+    if data is None:
+      out.write('None')
+      return
+    if isinstance(data, model.StructObject):
+      s_type._assert_type(data)
+    if len(s_type.fields) == 0:
+      out.write('{}')
+      return
+    if self._too_deep(depth):
+      out.write('{{ {} }}'.format(ELLIPSIS))
+      return
+    pad_str = ' ' * (pad_in + self._pad_size)
+    out.write('{\n')
+    for i, field in enumerate(s_type.fields):
+      out.write(',\n' if i > 0 else '')
+      out.write('{}{}: '.format(pad_str, field.name))
+      self.write(field.type, getattr(data, field.name), pad_in + self._pad_size, depth + 1)
+    out.write('\n{}}}'.format(' ' * pad_in))
+
+  def _write_list(self, l_type, data, pad_in, depth):
+    out = self._out
+    if not isinstance(data, (list, view.ListView)):
+      raise TypeError('Value is not a list')
+    count = len(data)
+    if count == 0:
+      out.write('[]')
+      return
+    if self._too_deep(depth):
+      out.write('[ {} {} elements ]'.format(ELLIPSIS, count))
+      return
+    shown = count if self._max_elements is None else min(count, self._max_elements)
+    if count == 1 and shown == 1:
+      out.write('[ ')
+      self.write(l_type.element_type, data[0], pad_in + self._pad_size, depth + 1)
+      out.write(' ]')
+      return
+    pad_str = ' ' * (pad_in + self._pad_size)
+    out.write('[\n')
+    for i, e in enumerate(itertools.islice(data, shown)):
+      out.write(',\n' if i > 0 else '')
+      out.write(pad_str)
+      self.write(l_type.element_type, e, pad_in + self._pad_size, depth + 1)
+    if shown < count:
+      out.write(',\n' if shown > 0 else '')
+      out.write('{}{} {} more'.format(pad_str, ELLIPSIS, count - shown))
+    out.write('\n{}]'.format(' ' * pad_in))
+
+
+def format_value(f_type, data, pad_in=0, pad_size=2):
+  out = io.StringIO()
+  ValuePrinter(out, pad_size).write(f_type, data, pad_in)
+  return out.getvalue()
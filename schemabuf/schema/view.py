@@ -0,0 +1,152 @@
+import schemabuf.schema.model as model
+from schemabuf.buffer import WriteBuffer, ReadBuffer
+
+UNDECODED = object()
+
+
+def _empty_columns(l_type, numpy):
+  buf = WriteBuffer()
+  l_type.pack(buf, [])
+  return l_type.unpack_column_form(ReadBuffer(buf.getvalue()), numpy)
+
+
+class StructView:
+
+  # Read-only view of a serialised struct. Only the tag header is parsed up front; each field is decoded on first
+  # access (nested structs and lists as further views) and memoised on the instance, so later reads are plain
+  # attribute lookups.
+
+  def __init__(self, s_type, buf):
+    codec = s_type.codec()
+    self._struct = s_type
+    self._buf = buf
+    self._start = buf.offset
+    _, self._types, self._skippers, self._positions = codec.layout(codec.read_header(buf))
+    self._offsets = [buf.offset]
+
+  def _offset(self, i):
+    offsets = self._offsets
+    if len(offsets) <= i:
+      offset = offsets[-1]
+      for skip in self._skippers[len(offsets) - 1:i]:
+        if isinstance(skip, int):
+          offset += skip
+        else:
+          buf = self._buf.at(offset)
+          skip(buf)
+          offset = buf.offset
+        offsets.append(offset)
+    return offsets[i]
+
+  def _end(self):
+    return self._offset(len(self._types))
+
+  def __getattr__(self, name):
+    if name.startswith('_'):
+      raise AttributeError(name)
+    field = self._struct.codec().field(name)
+    if field is None:
+      raise AttributeError(name)
+    i = self._positions.get(name)
+    if i is None:
+      value = field.type.default()
+    else:
+      value = self._types[i].unpack_view(self._buf.at(self._offset(i)))
+    self.__dict__[name] = value
+    return value
+
+  def columns(self, path, numpy=False):
+    # Column form of the list field at a dotted path (see List.unpack_column_form). An absent list, or one inside an
+    # absent struct, gives empty columns.
+    name, _, rest = path.partition('.')
+    field = self._struct.codec().field(name)
+    if field is None:
+      raise ValueError('Unknown field: {}'.format(path))
+    if rest:
+      if not isinstance(field.type, model.Struct):
+        raise ValueError('Cannot find columns in field: {}'.format(path))
+      value = getattr(self, name)
+      if value is None:
+        value = field.type.deserialise(field.type.serialise(field.type.create(), True), lazy=True)
+      return value.columns(rest, numpy)
+    if not isinstance(field.type, model.List):
+      raise TypeError('Field is not a list: {}'.format(path))
+    i = self._positions.get(name)
+    if i is None:
+      return _empty_columns(field.type, numpy)
+    f_type = self._types[i]
+    buf = self._buf.at(self._offset(i))
+    if isinstance(f_type, model.Delimited):
+      buf.skip(model.DELIMITER_PACKER.size)
+    return field.type.unpack_column_form(buf, numpy)
+
+  def materialise(self):
+    return self._struct.unpack(self._buf.at(self._start))
+
+  def __str__(self):
+    return str(self.materialise())
+
+
+class ListView:
+
+  # Read-only sequence over a serialised list. Element offsets are read from the list's offset index when it has
+  # one, and otherwise found by skipping over the preceding elements without building them. Each element is decoded
+  # (as a view where possible) only when it is indexed.
+
+  def __init__(self, element_type, buf, length, index=None):
+    self._element_type = element_type
+    self._buf = buf
+    self._length = length
+    self._index = index
+    self._offsets = [buf.offset]
+    # Decoded elements by index (the length is read from the message, so nothing is allocated for it up front)
+    self._elements = {}
+
+  def offset(self, i):
+    return self._offset(i)
+
+  def _offset(self, i):
+    if self._index is not None:
+      return self._offsets[0] + model.INDEX_PACKER.unpack_from(self._buf.data, self._index + i * model.INDEX_PACKER.size)[0]
+    offsets = self._offsets
+    while len(offsets) <= i:
+      j = len(offsets) - 1
+      element = self._elements.get(j)
+      if isinstance(element, StructView):
+        # A decoded element already knows where part of it ends, so finish its scan instead of skipping it again
+        offsets.append(element._end())
+      else:
+        buf = self._buf.at(offsets[j])
+        self._element_type.skip(buf)
+        offsets.append(buf.offset)
+    return offsets[i]
+
+  def __len__(self):
+    return self._length
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return [ self[j] for j in range(*i.indices(self._length)) ]
+    if i < 0:
+      i += self._length
+    if i < 0 or i >= self._length:
+      raise IndexError('List index out of range')
+    element = self._elements.get(i, UNDECODED)
+    if element is UNDECODED:
+      element = self._element_type.unpack_view(self._buf.at(self._offset(i)))
+      self._elements[i] = element
+    return element
+
+  def __iter__(self):
+    for i in range(self._length):
+      yield self[i]
+
+  def decode_range(self, start, stop):
+    # Eagerly decodes elements [start, stop) without touching the rest of the list
+    start, stop, _ = slice(start, stop).indices(self._length)
+    buf = self._buf.at(self._offset(start))
+    unpack_element = self._element_type.unpack
+    return [ unpack_element(buf) for i in range(start, stop) ]
+
+  def materialise(self):
+    return self.decode_range(0, self._length)
@@ -1,3 +1,21 @@
+import bz2
+import lzma
+import zlib
+from schemabuf.buffer import WriteBuffer
+
+CHUNK_SIZE = 0x10000
+
+
+def _process_chunks(stream, chunks):
+  for chunk in chunks:
+    data = stream.process(chunk)
+    if len(data) > 0:
+      yield data
+  data = stream.flush()
+  if len(data) > 0:
+    yield data
+
+
 class SerialisationFilter:
 
   def pre_serialise(self, data):
@@ -12,22 +30,117 @@ class SerialisationFilter:
   def post_deserialise(self, data):
     return data
 
+  def supports_streaming(self):
+    return False
+
+  def stream_serialiser(self):
+    return None
+
+  def stream_deserialiser(self):
+    return None
+
+  # The chunk hooks take an encoded payload as an iterable of bytes-like chunks and return an iterable of the
+  # filtered chunks. Filters that support streaming work through the chunks as they come; any other filter is given
+  # the whole payload at once.
+
+  def serialise_chunks(self, chunks):
+    if self.supports_streaming():
+      return _process_chunks(self.stream_serialiser(), chunks)
+    return iter([ self.post_serialise(b''.join(chunks)) ])
+
+  def deserialise_chunks(self, chunks):
+    if self.supports_streaming():
+      return _process_chunks(self.stream_deserialiser(), chunks)
+    return iter([ self.pre_deserialise(b''.join(chunks)) ])
+
+
+class StreamCompressor:
+
+  # sync_mode is the flush mode (such as zlib.Z_SYNC_FLUSH) that pushes out everything compressed so far without
+  # ending the stream, or None if the compressor has none
+
+  def __init__(self, compressor, sync_mode=None):
+    self._compressor = compressor
+    self._sync_mode = sync_mode
+
+  def process(self, data):
+    return self._compressor.compress(data)
+
+  def can_sync(self):
+    return self._sync_mode is not None
+
+  def sync(self):
+    return self._compressor.flush(self._sync_mode)
+
+  def flush(self):
+    return self._compressor.flush()
+
+
+class StreamDecompressor:
+
+  # A file written by several writers holds one compressed stream after another. Data after the end of a stream
+  # starts a new decompressor from new_decompressor, or raises ValueError if there isn't one.
+
+  def __init__(self, decompressor, new_decompressor=None):
+    self._decompressor = decompressor
+    self._new_decompressor = new_decompressor
+
+  def process(self, data):
+    output = []
+    while len(data) > 0:
+      if getattr(self._decompressor, 'eof', False):
+        if self._new_decompressor is None:
+          raise ValueError('Data after the end of the compressed stream')
+        self._decompressor = self._new_decompressor()
+      output.append(self._decompressor.decompress(data))
+      data = self._decompressor.unused_data if getattr(self._decompressor, 'eof', False) else b''
+    return b''.join(output)
+
+  def flush(self):
+    flush = getattr(self._decompressor, 'flush', None)
+    return flush() if flush is not None else b''
+
 
 class Serialiser:
 
-  def __init__(self, filters):
+  def __init__(self, filters, profile=None):
     self._filters = filters
+    # A schemabuf.profile.Profile that records the time spent in each filter hook and in the struct codec
+    self.profile = profile
+
+  def _run_profiled(self, before, convert, after, data):
+    # before and after are the (filter, hook name) pairs to run either side of convert
+    for f, hook in before:
+      data = self.profile.run_filter(f, hook, data)
+    data = convert(data)
+    for f, hook in after:
+      data = self.profile.run_filter(f, hook, data)
+    return data
 
-  def serialise(self, s_type, data):
+  def serialise(self, s_type, data, trusted=False):
+    if self.profile is not None:
+      return self._run_profiled(
+        [ (f, 'pre_serialise') for f in self._filters ],
+        lambda d: s_type.serialise(d, trusted, self.profile),
+        [ (f, 'post_serialise') for f in self._filters ],
+        data
+      )
     for f in self._filters:
       data = f.pre_serialise(data)
-    data = s_type.serialise(data)
+    data = s_type.serialise(data, trusted)
     for f in self._filters:
       data = f.post_serialise(data)
     
     return data
 
   def deserialise(self, s_type, data):
+    if self.profile is not None:
+      return self._run_profiled(
+        [ (f, 'pre_deserialise') for f in self._filters[::-1] ],
+        lambda d: s_type.deserialise(d, profile=self.profile),
+        [ (f, 'post_deserialise') for f in self._filters[::-1] ],
+        data
+      )
     for f in self._filters[::-1]:
       data = f.pre_deserialise(data)
     data = s_type.deserialise(data)
@@ -36,15 +149,149 @@ class Serialiser:
 
     return data
 
+  def serialise_chunks(self, s_type, data, trusted=False, chunk_size=CHUNK_SIZE):
+    # Encodes data and returns an iterator over the payload in chunks, passed through each filter's chunk hook in
+    # turn. The message is encoded once and handed to the filters as views of chunk_size bytes, so streaming filters
+    # (such as compression) produce their output as they go and the filtered payload is never joined in memory.
+    # Chunked calls aren't profiled.
+    for f in self._filters:
+      data = f.pre_serialise(data)
+    if not trusted:
+      s_type.assert_valid(data)
+    buf = WriteBuffer()
+    s_type.pack_message(buf, data)
+    view = buf.getbuffer()
+    chunks = ( view[i:i + chunk_size] for i in range(0, len(view), chunk_size) )
+    for f in self._filters:
+      chunks = f.serialise_chunks(chunks)
+    return chunks
+
+  def deserialise_chunks(self, s_type, chunks):
+    # Decodes a payload given as an iterable of chunks (e.g. from serialise_chunks, or reads from a file). Only the
+    # unfiltered message is gathered in memory.
+    for f in self._filters[::-1]:
+      chunks = f.deserialise_chunks(chunks)
+    payload = bytearray()
+    for chunk in chunks:
+      payload += chunk
+    data = s_type.deserialise(payload)
+    for f in self._filters[::-1]:
+      data = f.post_deserialise(data)
+
+    return data
+
+  # When serialising a stream of records, filters that provide a stream (de)serialiser are applied to the whole
+  # framed byte stream. The byte-level hooks of all other filters are applied to each record individually.
+
+  def serialise_record(self, s_type, data, trusted=False):
+    if self.profile is not None:
+      return self._run_profiled(
+        [ (f, 'pre_serialise') for f in self._filters ],
+        lambda d: s_type.serialise(d, trusted, self.profile),
+        [ (f, 'post_serialise') for f in self._filters if not f.supports_streaming() ],
+        data
+      )
+    for f in self._filters:
+      data = f.pre_serialise(data)
+    data = s_type.serialise(data, trusted)
+    for f in self._filters:
+      if not f.supports_streaming():
+        data = f.post_serialise(data)
+
+    return data
+
+  def deserialise_record(self, s_type, data):
+    if self.profile is not None:
+      return self._run_profiled(
+        [ (f, 'pre_deserialise') for f in self._filters[::-1] if not f.supports_streaming() ],
+        lambda d: s_type.deserialise(d, profile=self.profile),
+        [ (f, 'post_deserialise') for f in self._filters[::-1] ],
+        data
+      )
+    for f in self._filters[::-1]:
+      if not f.supports_streaming():
+        data = f.pre_deserialise(data)
+    data = s_type.deserialise(data)
+    for f in self._filters[::-1]:
+      data = f.post_deserialise(data)
+
+    return data
+
+  def stream_serialisers(self):
+    return [ f.stream_serialiser() for f in self._filters if f.supports_streaming() ]
+
+  def stream_deserialisers(self):
+    return [ f.stream_deserialiser() for f in self._filters[::-1] if f.supports_streaming() ]
+
 
 class CompressionSerialisationFilter(SerialisationFilter):
 
-  def __init__(self, compress_bytes, decompress_bytes):
+  def __init__(self, compress_bytes, decompress_bytes, compressor=None, decompressor=None, sync_mode=None):
     self.compress_bytes = compress_bytes
     self.decompress_bytes = decompress_bytes
+    self.compressor = compressor
+    self.decompressor = decompressor
+    # Flush mode of the compressor that lets record streams be flushed part way through (see StreamCompressor)
+    self.sync_mode = sync_mode
 
   def post_serialise(self, data):
     return self.compress_bytes(data)
 
   def pre_deserialise(self, data):
     return self.decompress_bytes(data)
+
+  def supports_streaming(self):
+    return self.compressor is not None and self.decompressor is not None
+
+  def stream_serialiser(self):
+    return StreamCompressor(self.compressor(), self.sync_mode)
+
+  def stream_deserialiser(self):
+    return StreamDecompressor(self.decompressor(), self.decompressor)
+
+
+class ZlibCompressionFilter(CompressionSerialisationFilter):
+
+  # zlib (deflate) compression at level 0-9 (or Z_DEFAULT_COMPRESSION). zdict is an optional preset dictionary: bytes
+  # that commonly occur in the payloads, such as a few concatenated sample messages, which lets small messages
+  # compress well. Payloads written with a zdict can only be read by a filter with the same zdict.
+
+  def __init__(self, level=zlib.Z_DEFAULT_COMPRESSION, zdict=None):
+    if zdict is None:
+      compressor = lambda: zlib.compressobj(level)
+      decompressor = zlib.decompressobj
+    else:
+      compressor = lambda: zlib.compressobj(level, zdict=zdict)
+      decompressor = lambda: zlib.decompressobj(zdict=zdict)
+    super().__init__(self._compress, self._decompress, compressor, decompressor, zlib.Z_SYNC_FLUSH)
+
+  def _compress(self, data):
+    compressor = self.compressor()
+    return compressor.compress(data) + compressor.flush()
+
+  def _decompress(self, data):
+    decompressor = self.decompressor()
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+class Bz2CompressionFilter(CompressionSerialisationFilter):
+
+  # bz2 and lzma compressors can't be flushed part way through a stream, so record streams compressed with them
+  # only produce output as blocks fill up and at close; use zlib for live streams
+
+  def __init__(self, level=9):
+    super().__init__(
+      lambda data: bz2.compress(data, level), bz2.decompress,
+      lambda: bz2.BZ2Compressor(level), bz2.BZ2Decompressor
+    )
+
+
+class LzmaCompressionFilter(CompressionSerialisationFilter):
+
+  # level is an lzma preset, 0-9, optionally or-ed with lzma.PRESET_EXTREME
+
+  def __init__(self, level=lzma.PRESET_DEFAULT):
+    super().__init__(
+      lambda data: lzma.compress(data, preset=level), lzma.decompress,
+      lambda: lzma.LZMACompressor(preset=level), lzma.LZMADecompressor
+    )
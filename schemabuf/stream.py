@@ -0,0 +1,141 @@
+import struct
+import schemabuf.serialiser as serialiser
+
+PACK_FRAME_LENGTH = '!I'
+FRAME_PACKER = struct.Struct(PACK_FRAME_LENGTH)
+READ_SIZE = 0x10000
+
+
+def frame(payload, streams):
+  # Frames an encoded record with its length and passes it through the stream serialisers
+  data = FRAME_PACKER.pack(len(payload)) + payload
+  for s in streams:
+    data = s.process(data)
+  return data
+
+
+def flush_streams(streams):
+  data = b''
+  for s in streams:
+    data = s.process(data) + s.flush()
+  return data
+
+
+def can_sync(streams):
+  return all([ getattr(s, 'can_sync', lambda: False)() for s in streams ])
+
+
+def check_sync(streams):
+  if not can_sync(streams):
+    raise ValueError('A stream filter cannot be flushed part way through a stream')
+
+
+def sync_streams(streams):
+  # Everything the stream serialisers have buffered, ending the current block without ending the stream
+  data = b''
+  for s in streams:
+    data = s.process(data) + s.sync()
+  return data
+
+
+def unframe(pending):
+  # Removes the complete frames at the start of pending (a bytearray) and returns their payloads
+  payloads = []
+  offset = 0
+  while len(pending) - offset >= FRAME_PACKER.size:
+    length = FRAME_PACKER.unpack_from(pending, offset)[0]
+    start = offset + FRAME_PACKER.size
+    if len(pending) - start < length:
+      break
+    payloads.append(bytes(pending[start:start + length]))
+    offset = start + length
+  del pending[:offset]
+  return payloads
+
+
+class RecordWriter:
+
+  # Writes a sequence of records to a file-like object, each framed by its length. Records are encoded and written
+  # one at a time, so only a single record is held in memory.
+  #
+  # Stream filters such as compression hold on to their output until it fills a block. flush() pushes out all the
+  # records written so far, and sync=True does so after every record, which a reader on the other end of a pipe or
+  # socket needs to see records as they are written (at some cost in compression). Both need every stream filter
+  # to support it (ZlibCompressionFilter does; bz2 and lzma don't) and raise ValueError otherwise.
+
+  def __init__(self, fileobj, s_type, record_serialiser=None, sync=False):
+    self._file = fileobj
+    self._type = s_type
+    self._serialiser = record_serialiser if record_serialiser is not None else serialiser.Serialiser([])
+    self._streams = self._serialiser.stream_serialisers()
+    if sync:
+      check_sync(self._streams)
+    self._sync = sync
+    self._closed = False
+
+  def write(self, data, trusted=False):
+    if self._closed:
+      raise ValueError('Writer is closed')
+    data = frame(self._serialiser.serialise_record(self._type, data, trusted), self._streams)
+    if self._sync:
+      data += sync_streams(self._streams)
+    if len(data) > 0:
+      self._file.write(data)
+
+  def flush(self):
+    if self._closed:
+      raise ValueError('Writer is closed')
+    check_sync(self._streams)
+    data = sync_streams(self._streams)
+    if len(data) > 0:
+      self._file.write(data)
+
+  def write_all(self, records, trusted=False):
+    for data in records:
+      self.write(data, trusted)
+
+  def close(self):
+    if self._closed:
+      return
+    self._closed = True
+    data = flush_streams(self._streams)
+    if len(data) > 0:
+      self._file.write(data)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+
+class RecordReader:
+
+  # Iterates over the records written by a RecordWriter, reading the source in fixed size chunks and yielding each
+  # record as soon as its frame is complete.
+
+  def __init__(self, fileobj, s_type, record_serialiser=None, read_size=READ_SIZE):
+    self._file = fileobj
+    self._type = s_type
+    self._serialiser = record_serialiser if record_serialiser is not None else serialiser.Serialiser([])
+    self._read_size = read_size
+
+  def _chunks(self):
+    streams = self._serialiser.stream_deserialisers()
+    while True:
+      chunk = self._file.read(self._read_size)
+      if not chunk:
+        break
+      for s in streams:
+        chunk = s.process(chunk)
+      yield chunk
+    yield flush_streams(streams)
+
+  def __iter__(self):
+    pending = bytearray()
+    for chunk in self._chunks():
+      pending += chunk
+      for payload in unframe(pending):
+        yield self._serialiser.deserialise_record(self._type, payload)
+    if len(pending) > 0:
+      raise EOFError('Stream ended part way through a record')
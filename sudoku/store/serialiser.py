@@ -1,6 +1,7 @@
 import zlib
 import schemabuf.schema.builder as schema
 import schemabuf.serialiser as schemaserialiser
+import schemabuf.registry as schemaregistry
 import sudoku.store.model as model
 
 
@@ -21,6 +22,11 @@ CompressingSerialiser = schemaserialiser.Serialiser([
 ])
 
 
+# Every board schema V4 files may have been written with. When SerialisableBoard changes, register the previous
+# version here so old files decode straight into the new shape.
+BoardSchemas = schemaregistry.SchemaRegistry([ SerialisableBoard ])
+
+
 class CellDeserialiserIterator:
 
   def __init__(self, elements):
@@ -187,6 +193,13 @@ class PuzzleSerialisationV3:
   FILE_FOOTER = b'\x04'
 
   def serialise(store):
+    return b''.join([
+      PuzzleSerialisationV3.FILE_HEADER,
+      CompressingSerialiser.serialise(SerialisableBoard, PuzzleSerialisationV3._board(store)),
+      PuzzleSerialisationV3.FILE_FOOTER
+    ])
+
+  def _board(store):
     board = SerialisableBoard.create()
     for x in range(9):
       for y in range(9):
@@ -198,21 +211,19 @@ class PuzzleSerialisationV3:
         s_cell.possible = list(cell.possible)
         board.cells.append(s_cell)
 
-    return b''.join([
-      PuzzleSerialisationV3.FILE_HEADER,
-      CompressingSerialiser.serialise(SerialisableBoard, board),
-      PuzzleSerialisationV3.FILE_FOOTER
-    ])
+    return board
 
   def format_matches(data):
     file_header_len = len(PuzzleSerialisationV3.FILE_HEADER)
     return len(data) > file_header_len and data[:file_header_len] == PuzzleSerialisationV3.FILE_HEADER
 
   def deserialise(data):
-    board = CompressingSerialiser.deserialise(
+    return PuzzleSerialisationV3._cells(CompressingSerialiser.deserialise(
       SerialisableBoard,
       data[len(PuzzleSerialisationV3.FILE_HEADER):-len(PuzzleSerialisationV3.FILE_FOOTER)]
-    )
+    ))
+
+  def _cells(board):
     x = 0
     y = 0
     for s_cell in board.cells:
@@ -229,15 +240,44 @@ class PuzzleSerialisationV3:
       yield c_x, c_y, cell
 
 
+class PuzzleSerialisationV4:
+
+  # Structure:
+  # FILE_HEADER | zlib(schema fingerprint | SerialisableBoard) | FILE_FOOTER
+  # The fingerprint names the board schema the file was written with (see BoardSchemas)
+
+  FILE_HEADER = b'\x01<!SAMOURSUDOKU\x1f\x04>\x1d'
+  FILE_FOOTER = b'\x04'
+
+  def serialise(store):
+    return b''.join([
+      PuzzleSerialisationV4.FILE_HEADER,
+      zlib.compress(BoardSchemas.serialise(SerialisableBoard, PuzzleSerialisationV3._board(store))),
+      PuzzleSerialisationV4.FILE_FOOTER
+    ])
+
+  def format_matches(data):
+    file_header_len = len(PuzzleSerialisationV4.FILE_HEADER)
+    return len(data) > file_header_len and data[:file_header_len] == PuzzleSerialisationV4.FILE_HEADER
+
+  def deserialise(data):
+    return PuzzleSerialisationV3._cells(BoardSchemas.deserialise(
+      SerialisableBoard,
+      zlib.decompress(data[len(PuzzleSerialisationV4.FILE_HEADER):-len(PuzzleSerialisationV4.FILE_FOOTER)])
+    ))
+
+
 class PuzzleSerialisation:
 
   @staticmethod
   def serialise(store):
-    return PuzzleSerialisationV3.serialise(store)
+    return PuzzleSerialisationV4.serialise(store)
 
   @staticmethod
   def deserialise(data):
-    if PuzzleSerialisationV3.format_matches(data):
+    if PuzzleSerialisationV4.format_matches(data):
+      return PuzzleSerialisationV4.deserialise(data)
+    elif PuzzleSerialisationV3.format_matches(data):
       return PuzzleSerialisationV3.deserialise(data)
     elif PuzzleSerialisationV2.format_matches(data):
       return PuzzleSerialisationV2.deserialise(data)